@@ -1,2 +1,3 @@
 from .model.read.query import QueryBuilder, Query
 from .model.read.result import Result
+from .model.read.cache import dataset_cache
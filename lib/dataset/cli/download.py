@@ -1,25 +1,71 @@
-from ..infrastructure.request import request_context
+from typing import Optional
+from ..infrastructure.request import RateLimit, request_context
+from ..infrastructure.cassette import Cassette, ReplayTransport
 from ..source import source_instance
+from ..source.kraken_rest import RATE_LIMIT_RESPONSE
 from ..model.write.writer import DatasetWriter
+from collections import deque
 import asyncio, time, click
 from pathlib import Path
 
+# Minimum number of seconds left to start downloading another market.
+MIN_MARKET_TIME = 5
 
-async def download_async(data_dir: str, timeout: float):
-    start_time = time.time()
+DEFAULT_CONCURRENCY = 4
+
+
+async def download_async(data_dir: str, timeout: float, concurrency: int = 1):
+    """
+    Download the trading data of all markets, with at most `concurrency`
+    markets in flight. All markets share the source, so requests to the
+    exchange API go through one rate limiter.
+
+    The timeout budget is split fairly: whenever a market is started, it gets
+    its share of the remaining time, i.e. the remaining time divided by the
+    number of markets left (or in flight) per worker. Time left over by
+    markets that are already up to date is handed on to the markets after
+    them.
+    """
+
+    deadline = time.time() + timeout
 
     writer = DatasetWriter(data_dir)
     source = source_instance("kraken_rest")
 
     async with request_context():
-        for market in await source.markets():
-            elapsed_time = time.time() - start_time
-            remaining_time = timeout - elapsed_time
-            if remaining_time < 5:
-                break
+        markets = deque(await source.markets())
+        num_workers = max(1, min(concurrency, len(markets)))
+        in_flight = 0
+
+        async def download_markets():
+            nonlocal in_flight
+            while markets:
+                remaining_time = deadline - time.time()
+                if remaining_time < MIN_MARKET_TIME:
+                    break
 
-            print(f"Downloading trading data for {market}:")
-            await writer.write_trades(str(market), source, timeout=remaining_time)
+                num_markets = len(markets) + in_flight
+                market_time = remaining_time * min(1.0, num_workers / num_markets)
+                market = markets.popleft()
+                print(f"Downloading trading data for {market}:")
+                in_flight += 1
+                try:
+                    await writer.write_trades(
+                        str(market),
+                        source,
+                        timeout=max(market_time, MIN_MARKET_TIME),
+                    )
+                finally:
+                    in_flight -= 1
+
+        workers = [asyncio.create_task(download_markets()) for _ in range(num_workers)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            writer.close()
 
 
 @click.command()
@@ -37,10 +83,65 @@ async def download_async(data_dir: str, timeout: float):
     help="Maximum number of minutes to download trading data.",
     type=float,
 )
-def download(data_dir: str, timeout: float):
+@click.option(
+    "-c",
+    "--concurrency",
+    default=DEFAULT_CONCURRENCY,
+    help="Maximum number of markets to download at the same time.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False),
+    help="Record the API responses to a cassette file.",
+)
+@click.option(
+    "--replay",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Replay the API responses of a cassette file, without a network.",
+)
+@click.option(
+    "--replay-latency",
+    default=0.0,
+    help="Number of seconds to delay each replayed response.",
+    type=float,
+)
+@click.option(
+    "--replay-rate-limit",
+    help="Rate limit of the replayed API as LIMIT:DECAY, e.g. 15:0.33.",
+)
+def download(
+    data_dir: str,
+    timeout: float,
+    concurrency: int,
+    record: Optional[str],
+    replay: Optional[str],
+    replay_latency: float,
+    replay_rate_limit: Optional[str],
+):
+    transport = None
+    if record:
+        request_context().record(Cassette(Path(record)))
+    if replay:
+        rate_limit = None
+        if replay_rate_limit:
+            limit, decay = map(float, replay_rate_limit.split(":", 1))
+            rate_limit = RateLimit(limit, decay)
+        transport = ReplayTransport(
+            Cassette.load(Path(replay)),
+            latency=replay_latency,
+            rate_limit=rate_limit,
+            rate_limited_response=RATE_LIMIT_RESPONSE,
+        )
+        request_context().replay(transport)
+
     asyncio.run(
         download_async(
             data_dir=data_dir,
             timeout=timeout * 60,
+            concurrency=concurrency,
         )
     )
+
+    if transport:
+        print(transport)
@@ -1,11 +1,14 @@
 from ..model.write.writer import DatasetWriter
-import asyncio, time, click
+import asyncio, os, time, click
 from pathlib import Path
 
 
-async def index_async(data_dir: str):
+async def index_async(data_dir: str, workers: int = 1, full: bool = False):
     writer = DatasetWriter(data_dir)
-    await writer.index()
+    try:
+        await writer.index(workers=workers, full=full)
+    finally:
+        writer.close()
 
 
 @click.command()
@@ -16,5 +19,17 @@ async def index_async(data_dir: str):
     envvar="DATASET_DIR",
     help="Directory to index trading data.",
 )
-def index(data_dir: str):
-    asyncio.run(index_async(data_dir=data_dir))
+@click.option(
+    "-w",
+    "--workers",
+    default=os.cpu_count() or 1,
+    help="Number of processes to index partitions in parallel.",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    help="Index all partitions, not only those written since the last index.",
+)
+def index(data_dir: str, workers: int, full: bool):
+    asyncio.run(index_async(data_dir=data_dir, workers=workers, full=full))
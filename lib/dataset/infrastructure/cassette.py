@@ -0,0 +1,156 @@
+import asyncio
+import gzip
+import json
+from pathlib import Path
+from secrets import token_hex
+from typing import Any, Dict, List, Optional
+from .request import RateLimit, RateLimiter
+
+
+def request_key(method: str, url: str, **kwargs) -> str:
+    """
+    Key of a request in a cassette: its method, URL, query parameters and
+    JSON body.
+
+    >>> request_key("post", "https://api.kraken.com/0/public/Trades", json={"since": 0, "pair": "XXBTZEUR"})
+    '["POST", "https://api.kraken.com/0/public/Trades", null, {"pair": "XXBTZEUR", "since": 0}]'
+    """
+
+    return json.dumps(
+        [method.upper(), url, kwargs.get("params"), kwargs.get("json")],
+        sort_keys=True,
+    )
+
+
+class Cassette:
+    """
+    Recording of HTTP requests and their JSON responses, to be replayed
+    without a network. It is stored as gzipped JSON lines, one line per
+    request. Responses are kept as JSON text, so replaying them costs the
+    same parsing as a real response.
+
+    >>> cassette = Cassette()
+    >>> cassette.record("POST", "https://example.com/a", {"json": {"n": 1}}, {"v": 1})
+    >>> cassette.record("POST", "https://example.com/a", {"json": {"n": 1}}, {"v": 2})
+    >>> cassette.responses("POST", "https://example.com/a", json={"n": 1})
+    ['{"v":1}', '{"v":2}']
+    >>> len(cassette)
+    2
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._entries: List[Dict[str, Any]] = []
+        self._responses: Dict[str, List[str]] = {}
+
+    @staticmethod
+    def load(path: Path) -> "Cassette":
+        cassette = Cassette(path)
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                cassette._add(json.loads(line))
+        return cassette
+
+    def record(self, method: str, url: str, kwargs: Dict[str, Any], response: Any):
+        self._add(
+            {
+                "method": method.upper(),
+                "url": url,
+                "params": kwargs.get("params"),
+                "json": kwargs.get("json"),
+                "response": json.dumps(response, separators=(",", ":")),
+            }
+        )
+
+    def responses(self, method: str, url: str, **kwargs) -> List[str]:
+        return self._responses.get(request_key(method, url, **kwargs), [])
+
+    def save(self, path: Optional[Path] = None):
+        path = Path(path or self.path)  # type: ignore
+        tmp_path = path.with_name(f"{path.name}.new_{token_hex(6)}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+            for entry in self._entries:
+                file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        tmp_path.rename(path)
+
+    def _add(self, entry: Dict[str, Any]):
+        key = request_key(
+            entry["method"],
+            entry["url"],
+            params=entry["params"],
+            json=entry["json"],
+        )
+        self._entries.append(entry)
+        self._responses.setdefault(key, []).append(entry["response"])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        path = repr(str(self.path)) if self.path else None
+        return f"<Cassette path={path} num_requests={len(self)}>"
+
+
+class ReplayTransport:
+    """
+    Serves the responses of a cassette instead of making HTTP requests, each
+    after a fixed latency. Identical requests get the recorded responses in
+    order, repeating the last one when they run out.
+
+    With a rate limit, the transport acts like a server that counts every
+    call, and answers `rate_limited_response` (or raises, if there is none)
+    to calls over the limit.
+
+    >>> cassette = Cassette()
+    >>> cassette.record("GET", "https://example.com/a", {}, {"v": 1})
+    >>> transport = ReplayTransport(cassette, rate_limit=RateLimit(limit=1, decay=0.001))
+    >>> asyncio.run(transport.request("GET", "https://example.com/a"))
+    {'v': 1}
+    >>> asyncio.run(transport.request("GET", "https://example.com/a"))
+    Traceback (most recent call last):
+    ...
+    RuntimeError: ReplayTransport: rate limit exceeded: https://example.com/a
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        latency: float = 0.0,
+        rate_limit: Optional[RateLimit] = None,
+        rate_limited_response: Optional[Any] = None,
+    ):
+        self.cassette = cassette
+        self.latency = latency
+        self.rate_limited_response = rate_limited_response
+        self._limiter = RateLimiter(*rate_limit) if rate_limit else None
+        self._positions: Dict[str, int] = {}
+        self.num_requests = 0
+        self.num_rate_limited = 0
+
+    async def request(self, method: str, url: str, **kwargs):
+        self.num_requests += 1
+        rate_limited = self._limiter is not None and self._limiter.reserve() > 0
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        if rate_limited:
+            self.num_rate_limited += 1
+            if self.rate_limited_response is None:
+                raise RuntimeError(f"ReplayTransport: rate limit exceeded: {url}")
+            return self.rate_limited_response
+
+        responses = self.cassette.responses(method, url, **kwargs)
+        if not responses:
+            raise LookupError(f"ReplayTransport: request not recorded: {method} {url}")
+
+        key = request_key(method, url, **kwargs)
+        position = self._positions.get(key, 0)
+        self._positions[key] = position + 1
+        return json.loads(responses[min(position, len(responses) - 1)])
+
+    def __repr__(self) -> str:
+        return (
+            f"<ReplayTransport num_requests={self.num_requests}"
+            f" num_rate_limited={self.num_rate_limited}>"
+        )
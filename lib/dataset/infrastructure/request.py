@@ -1,9 +1,26 @@
 import aiohttp
 import asyncio
 import time
-from typing import Optional
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+
+class RateLimit(NamedTuple):
+    limit: float
+    decay: float
+
+
+# -- Rate limits by host and path prefix (e.g. an API tier) --
+# Modelled after the call counter of Kraken, see RateLimiter. Public Kraken
+# endpoints are limited per IP at about one call per second, without a
+# documented burst, so no burst is allowed.
+RATE_LIMITS: Dict[str, RateLimit] = {
+    "api.kraken.com/0/public/": RateLimit(limit=1, decay=1.0),
+    "api.kraken.com/0/private/": RateLimit(limit=15, decay=0.33),
+}
 
 _HTTP_CONTEXT = None
+_RATE_LIMITERS: Dict[str, "RateLimiter"] = {}
 
 
 def request_context():
@@ -13,6 +30,39 @@ def request_context():
     return _HTTP_CONTEXT
 
 
+def rate_limiter(url: str, throttle_wait: float = 0) -> Optional["RateLimiter"]:
+    """
+    Get the rate limiter shared by all requests to the host or API tier of an
+    URL, as configured in RATE_LIMITS. Other hosts are limited to one call per
+    `throttle_wait` seconds, or not at all.
+
+    >>> rate_limiter("https://api.kraken.com/0/public/Trades")
+    RateLimiter(limit=1, decay=1.0)
+    >>> rate_limiter("https://api.kraken.com/0/public/Trades") is rate_limiter(
+    ...     "https://api.kraken.com/0/public/AssetPairs"
+    ... )
+    True
+    >>> rate_limiter("https://httpbin.org/get") is None
+    True
+    """
+
+    url_parts = urlsplit(url)
+    location = f"{url_parts.hostname}{url_parts.path}"
+    keys = [key for key in RATE_LIMITS if location.startswith(key)]
+    if keys:
+        key = max(keys, key=len)
+        rate_limit = RATE_LIMITS[key]
+    elif throttle_wait > 0:
+        key = str(url_parts.hostname)
+        rate_limit = RateLimit(limit=1, decay=1 / throttle_wait)
+    else:
+        return None
+
+    if key not in _RATE_LIMITERS:
+        _RATE_LIMITERS[key] = RateLimiter(*rate_limit)
+    return _RATE_LIMITERS[key]
+
+
 def request_client(
     throttle_wait: float = 0,
     timeout: float = 30,
@@ -31,6 +81,32 @@ class HTTPContext:
     def __init__(self):
         self._sessions = None
         self._ref_count = 0
+        self._cassette = None
+        self._transport = None
+
+    @property
+    def cassette(self):
+        return self._cassette
+
+    @property
+    def transport(self):
+        return self._transport
+
+    def record(self, cassette):
+        """
+        Record all responses to the given cassette (see `cassette.Cassette`),
+        which is saved when the context is closed.
+        """
+
+        self._cassette = cassette
+
+    def replay(self, transport):
+        """
+        Serve all requests from the given transport (see
+        `cassette.ReplayTransport`) instead of the network.
+        """
+
+        self._transport = transport
 
     def session(self, *args, **kwargs):
         """
@@ -59,6 +135,61 @@ class HTTPContext:
         await asyncio.gather(*[s.close() for s in sessions], return_exceptions=True)
         await asyncio.sleep(0.250)
 
+        if self._cassette is not None and self._cassette.path:
+            self._cassette.save()
+
+
+class RateLimiter:
+    """
+    Token bucket in the form of a call counter, like the rate limits of the
+    Kraken API: each call adds its cost to the counter, and the counter decays
+    by `decay` per second. A call that takes the counter above `limit` waits
+    until it has decayed enough. Calls reserve their cost up front, so
+    concurrent callers are served in order and together never exceed the
+    limit, while an idle limiter allows a burst of up to `limit` calls.
+
+    >>> limiter = RateLimiter(limit=2, decay=0.5)
+    >>> [limiter.reserve(now=0) for _ in range(4)]
+    [0.0, 0.0, 2.0, 4.0]
+    >>> limiter.reserve(now=10)
+    0.0
+    """
+
+    def __init__(self, limit: float, decay: float):
+        self.limit = limit
+        self.decay = decay
+        self._counter = 0.0
+        self._updated: Optional[float] = None
+
+    def reserve(self, cost: float = 1, now: Optional[float] = None) -> float:
+        """
+        Count a call, returning the number of seconds to wait before making it.
+        """
+
+        now = time.monotonic() if now is None else now
+        if self._updated is not None:
+            elapsed = max(0.0, now - self._updated)
+            self._counter = max(0.0, self._counter - elapsed * self.decay)
+        self._updated = now
+
+        self._counter += cost
+        return max(0.0, (self._counter - self.limit) / self.decay)
+
+    async def acquire(self, cost: float = 1):
+        await asyncio.sleep(self.reserve(cost))
+
+    def exhaust(self):
+        """
+        Fill the counter up to the limit, e.g. after the server reported that
+        the rate limit was exceeded, so all callers back off.
+        """
+
+        self.reserve(cost=0)
+        self._counter = max(self._counter, self.limit)
+
+    def __repr__(self) -> str:
+        return f"RateLimiter(limit={self.limit}, decay={self.decay})"
+
 
 class HTTPSession:
     def __init__(
@@ -69,7 +200,6 @@ class HTTPSession:
         raise_for_status: bool,
     ):
         self.throttle_wait = throttle_wait
-        self._throttle_last = 0
 
         self._session = request_context().session(
             timeout=aiohttp.ClientTimeout(
@@ -79,26 +209,30 @@ class HTTPSession:
             raise_for_status=raise_for_status,
         )
 
-    async def throttle(self):
-        if self.throttle_wait <= 0:
-            return
+    async def throttle(self, url: str):
+        limiter = rate_limiter(url, self.throttle_wait)
+        if limiter:
+            await limiter.acquire()
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
 
-        now = time.time()
-        waited_already = now - self._throttle_last
-        remaining_time = max(0.0, self.throttle_wait - waited_already)
+    async def request(self, method: str, url: str, **kwargs):
+        await self.throttle(url)
 
-        self._throttle_last = now + remaining_time
-        await asyncio.sleep(remaining_time)
+        context = request_context()
+        if context.transport is not None:
+            return await context.transport.request(method, url, **kwargs)
 
-    async def get(self, url: str, *args, **kwargs):
-        await self.throttle()
-        async with self._session.get(url, *args, **kwargs) as response:
-            return await response.json()
+        async with self._session.request(method, url, **kwargs) as response:
+            result = await response.json()
 
-    async def post(self, url: str, *args, **kwargs):
-        await self.throttle()
-        async with self._session.post(url, *args, **kwargs) as response:
-            return await response.json()
+        if context.cassette is not None:
+            context.cassette.record(method, url, kwargs, result)
+        return result
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+from typing import Dict, Iterator, List
+from contextlib import contextmanager
+from pathlib import Path
+from secrets import token_hex
+import fcntl
+import json
+from .types import TimeInterval
+
+JOURNAL_NAME = "_journal.jsonl"
+
+# Lock file serializing the appends to the journal and taking it.
+JOURNAL_LOCK_NAME = "_journal.lock"
+
+
+def merge_periods(periods: List[TimeInterval]) -> List[TimeInterval]:
+    """
+    Merge overlapping and adjacent periods.
+
+    >>> merge_periods([
+    ...     TimeInterval("2020-11-03", "2020-11-04"),
+    ...     TimeInterval("2020-10-05", "2020-10-06"),
+    ...     TimeInterval("2020-11-02", "2020-11-03"),
+    ... ])
+    [TimeInterval('2020-10-05Z', '2020-10-06Z'), TimeInterval('2020-11-02Z', '2020-11-04Z')]
+    """
+
+    merged: List[TimeInterval] = []
+    for period in sorted(periods, key=lambda p: (p.start, p.end)):
+        if merged and period.start <= merged[-1].end:
+            if period.end > merged[-1].end:
+                merged[-1] = merged[-1].with_end(period.end)
+            continue
+        merged.append(period)
+    return merged
+
+
+class Journal:
+    """
+    Log of the partition directories (and periods) of a subject that were
+    written since they were last indexed, so indexing can skip everything
+    else. Writers append one JSON line per file, which is cheap.
+
+    Indexing takes the journal by renaming it, so entries appended meanwhile
+    go to a new journal. Appending and taking hold a lock file, so no entry
+    is appended to a journal after it was taken. The taken journals are
+    removed with `commit()` once indexed. Taken journals of an interrupted
+    run are taken again by the next run.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     journal = Journal(Path(tmp))
+    ...     dir = Path(tmp) / "year=2020/exchange=kraken/instrument=btc_eur/source=kraken_rest"
+    ...     journal.append(dir, TimeInterval("2020-11-01T10:00", "2020-11-01T12:00"))
+    ...     journal.append(dir, TimeInterval("2020-11-01T12:00", "2020-11-02"))
+    ...     [(d.name, p) for d, p in journal.take().items()]
+    ...     journal.commit()
+    ...     journal.take()
+    [('source=kraken_rest', [TimeInterval('2020-11-01T10Z', '2020-11-02Z')])]
+    {}
+    """
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._taken: List[Path] = []
+
+    @property
+    def file(self) -> Path:
+        return self._path / JOURNAL_NAME
+
+    def append(self, dir: Path, period: TimeInterval):
+        entry = {
+            "path": dir.relative_to(self._path).as_posix(),
+            "start": period.start.value,
+            "end": period.end.value,
+        }
+        with self._lock():
+            with open(self.file, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry) + "\n")
+
+    def take(self) -> Dict[Path, List[TimeInterval]]:
+        """
+        Take the journal, returning the written periods per directory.
+        """
+
+        with self._lock():
+            if self.file.exists():
+                taken_name = f"{JOURNAL_NAME}.{token_hex(6)}"
+                self.file.rename(self.file.with_name(taken_name))
+            self._taken = sorted(self._path.glob(f"{JOURNAL_NAME}.*"))
+
+        dirs: Dict[Path, List[TimeInterval]] = {}
+        for taken_file in self._taken:
+            with open(taken_file, encoding="utf-8") as file:
+                for line in file:
+                    if not line.endswith("\n"):
+                        continue
+                    entry = json.loads(line)
+                    period = TimeInterval(entry["start"], entry["end"])
+                    dirs.setdefault(self._path / entry["path"], []).append(period)
+        return {dir: merge_periods(periods) for dir, periods in dirs.items()}
+
+    def commit(self):
+        """
+        Remove the taken journals, after their directories were indexed.
+        """
+
+        for taken_file in self._taken:
+            taken_file.unlink(missing_ok=True)
+        self._taken = []
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        self._path.mkdir(parents=True, exist_ok=True)
+        with open(self._path / JOURNAL_LOCK_NAME, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __repr__(self) -> str:
+        return f"<Journal path={repr(str(self._path))}>"
@@ -0,0 +1,305 @@
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from secrets import token_hex
+import fcntl
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from .partition import Partition
+from .types import Market, TimeInterval
+
+MANIFEST_NAME = "_manifest.parquet"
+
+# Lock file serializing the updates of the manifest by all processes.
+MANIFEST_LOCK_NAME = "_manifest.lock"
+PARTITION_GLOB = "year=*/exchange=*/instrument=*/source=*/*.parquet"
+
+# Fields given by the hive directories of a partition file.
+PARTITION_FIELDS = [
+    pa.field("year", pa.int32()),
+    pa.field("exchange", pa.string()),
+    pa.field("instrument", pa.string()),
+    pa.field("source", pa.string()),
+]
+
+TIME_TYPE = pa.timestamp("ns", tz="UTC")
+
+MANIFEST_SCHEMA = pa.schema(
+    [
+        pa.field("path", pa.string(), nullable=False),
+        pa.field("source", pa.string(), nullable=False),
+        pa.field("exchange", pa.string(), nullable=False),
+        pa.field("instrument", pa.string(), nullable=False),
+        pa.field("period_start", TIME_TYPE, nullable=False),
+        pa.field("period_end", TIME_TYPE, nullable=False),
+        pa.field("num_rows", pa.int64(), nullable=False),
+        pa.field("time_min", TIME_TYPE),
+        pa.field("time_max", TIME_TYPE),
+        pa.field("size", pa.int64(), nullable=False),
+        pa.field("mtime_ns", pa.int64(), nullable=False),
+    ]
+)
+
+# Key of the dataset schema in the manifest file metadata.
+SCHEMA_METADATA_KEY = b"dataset_schema"
+
+
+def partition_expression(path: str) -> ds.Expression:
+    """
+    Get the dataset expression given by the hive directories of a partition
+    file path.
+
+    >>> partition_expression("year=2020/exchange=kraken/instrument=btc_eur/source=kraken_rest/2020.parquet").equals(
+    ...     (ds.field("year") == 2020)
+    ...     & (ds.field("exchange") == "kraken")
+    ...     & (ds.field("instrument") == "btc_eur")
+    ...     & (ds.field("source") == "kraken_rest")
+    ... )
+    True
+    """
+
+    expression = None
+    for part in PurePosixPath(path).parts[-5:-1]:
+        key, value = part.split("=", 1)
+        f = ds.field(key) == (int(value) if key == "year" else value)
+        expression = f if expression is None else expression & f
+    return expression
+
+
+class ManifestEntry(NamedTuple):
+    path: str
+    source: str
+    exchange: str
+    instrument: str
+    period_start: int
+    period_end: int
+    num_rows: int
+    time_min: Optional[int]
+    time_max: Optional[int]
+    size: int
+    mtime_ns: int
+
+    @property
+    def partition(self) -> Partition:
+        """
+        The partition of the file. If the time range of the records in the file
+        is known, the period is narrowed down to it.
+        """
+
+        start = self.period_start
+        end = self.period_end
+        if self.time_min is not None and self.time_max is not None:
+            start = max(start, self.time_min)
+            end = min(end, self.time_max + 1)
+        market = Market(self.exchange, self.instrument)
+        return Partition(self.source, market, TimeInterval(start, end))
+
+    @property
+    def partition_expression(self) -> ds.Expression:
+        return partition_expression(self.path)
+
+
+class Manifest:
+    """
+    Catalog of the partition files of a subject, stored as a small Parquet file
+    next to the hive directories. It lists every file with its market, source,
+    period, row count and time range, so queries can build the dataset without
+    walking the directory tree or reading any Parquet footers.
+    """
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._entries: Optional[Dict[str, ManifestEntry]] = None
+        self._schema: Optional[pa.Schema] = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def file(self) -> Path:
+        return self._path / MANIFEST_NAME
+
+    def exists(self) -> bool:
+        return self.file.is_file()
+
+    @property
+    def schema(self) -> Optional[pa.Schema]:
+        self._load()
+        return self._schema
+
+    def entries(self) -> List[ManifestEntry]:
+        return sorted(self._load().values())
+
+    def refresh(self, *dirs: Path):
+        """
+        Update the entries of the given partition directories. Only files that
+        are new or changed since the last refresh are opened.
+
+        Updates are serialized by a lock file and start from the manifest on
+        disk, so concurrent writers and indexers never drop each other's
+        entries. If there is no manifest yet, it is built from all partition
+        directories instead, since queries trust it to list every file.
+        """
+
+        with self._lock():
+            if not self.exists():
+                self._rebuild()
+                return
+            entries = self._read()
+            self._update(entries, dirs)
+            self._save(entries)
+            self._entries = entries
+
+    def rebuild(self):
+        """
+        Refresh all partition directories and forget directories that no
+        longer exist.
+        """
+
+        with self._lock():
+            self._rebuild()
+
+    def _rebuild(self):
+        entries = self._read()
+        dirs = set(file.parent for file in self._path.glob(PARTITION_GLOB))
+        rel_dirs = set(dir.relative_to(self._path).as_posix() for dir in dirs)
+        for path in list(entries.keys()):
+            if path.rsplit("/", 1)[0] not in rel_dirs:
+                del entries[path]
+        self._update(entries, sorted(dirs))
+        self._save(entries)
+        self._entries = entries
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        self._path.mkdir(parents=True, exist_ok=True)
+        with open(self._path / MANIFEST_LOCK_NAME, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update(self, entries: Dict[str, ManifestEntry], dirs):
+        for dir in dirs:
+            rel_dir = dir.relative_to(self._path).as_posix()
+            old_entries = {
+                path: entry
+                for path, entry in entries.items()
+                if path.rsplit("/", 1)[0] == rel_dir
+            }
+            for path in old_entries.keys():
+                del entries[path]
+            for file in dir.glob("*.parquet"):
+                entry = self._entry(file, old_entries)
+                if entry:
+                    entries[entry.path] = entry
+
+    def _entry(
+        self,
+        file: Path,
+        old_entries: Dict[str, ManifestEntry],
+    ) -> Optional[ManifestEntry]:
+        path = file.relative_to(self._path).as_posix()
+        partition = Partition.from_path(file)
+        if not partition:
+            return None
+
+        stat = file.stat()
+        old_entry = old_entries.get(path)
+        if old_entry:
+            if (
+                old_entry.size == stat.st_size
+                and old_entry.mtime_ns == stat.st_mtime_ns
+            ):
+                return old_entry
+
+        metadata = pq.read_metadata(file)
+        if self._schema is None:
+            file_schema = metadata.schema.to_arrow_schema()
+            self._schema = pa.schema(list(file_schema) + PARTITION_FIELDS)
+
+        time_min, time_max = self._time_range(metadata)
+        return ManifestEntry(
+            path=path,
+            source=partition.source,
+            exchange=partition.market.exchange,
+            instrument=partition.market.instrument,
+            period_start=partition.period.start.value,
+            period_end=partition.period.end.value,
+            num_rows=metadata.num_rows,
+            time_min=time_min,
+            time_max=time_max,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+        )
+
+    def _time_range(self, metadata: pq.FileMetaData):
+        columns = [metadata.schema.column(i).path for i in range(metadata.num_columns)]
+        if "time" not in columns or metadata.num_row_groups == 0:
+            return None, None
+
+        index = columns.index("time")
+        time_min = None
+        time_max = None
+        for i in range(metadata.num_row_groups):
+            statistics = metadata.row_group(i).column(index).statistics
+            if not (statistics and statistics.has_min_max):
+                return None, None
+            if time_min is None or statistics.min_raw < time_min:
+                time_min = statistics.min_raw
+            if time_max is None or statistics.max_raw > time_max:
+                time_max = statistics.max_raw
+        return time_min, time_max
+
+    def _load(self) -> Dict[str, ManifestEntry]:
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def _read(self) -> Dict[str, ManifestEntry]:
+        entries: Dict[str, ManifestEntry] = {}
+        if not self.exists():
+            return entries
+
+        table = pq.read_table(self.file)
+        metadata = table.schema.metadata or {}
+        if SCHEMA_METADATA_KEY in metadata:
+            buffer = pa.py_buffer(metadata[SCHEMA_METADATA_KEY])
+            self._schema = pa.ipc.read_schema(buffer)
+
+        columns = [
+            table[name].cast(pa.int64()) if field.type == TIME_TYPE else table[name]
+            for name, field in zip(MANIFEST_SCHEMA.names, MANIFEST_SCHEMA)
+        ]
+        for values in zip(*[column.to_pylist() for column in columns]):
+            entry = ManifestEntry(*values)
+            entries[entry.path] = entry
+        return entries
+
+    def _save(self, entries: Dict[str, ManifestEntry]):
+        rows = sorted(entries.values())
+        metadata = {}
+        if self._schema is not None:
+            metadata[SCHEMA_METADATA_KEY] = self._schema.serialize().to_pybytes()
+
+        table = pa.Table.from_arrays(
+            [
+                pa.array([entry[index] for entry in rows], type=field.type)
+                for index, field in enumerate(MANIFEST_SCHEMA)
+            ],
+            schema=MANIFEST_SCHEMA.with_metadata(metadata),
+        )
+
+        tmp_file = self.file.with_name(f"{self.file.name}.new_{token_hex(6)}")
+        self._path.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, tmp_file, compression="ZSTD", version="2.0")
+        tmp_file.rename(self.file)
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __repr__(self) -> str:
+        return f"<Manifest path={repr(str(self._path))} num_files={len(self)}>"
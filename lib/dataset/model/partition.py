@@ -1,4 +1,33 @@
+from typing import Callable, Optional, Union
+from pathlib import PurePath
+import re
 from .types import Market, TimeInterval
+from .period import parse_period
+
+PARTITION_PATH_REGEX = re.compile(
+    r"(?:\A|/)(?P<subject>[\w\-]+)/year=(?P<year>\d{4})/exchange=(?P<exchange>[\w\-]+)/instrument=(?P<instrument>[\w\-]+)/source=(?P<source>[\w\-]+)/(?P<name>[^/]+)\.parquet\Z"
+)
+
+
+def parse_filename_period(name: str) -> TimeInterval:
+    """
+    Get the period covered by a partition file from its name (without the
+    `.parquet` extension), as written by `Partition.path()`.
+
+    >>> parse_filename_period("2020-11-02.kraken.btc_eur.kraken_rest.trades")
+    TimeInterval('2020-11-02Z', '2020-11-03Z')
+    >>> parse_filename_period("2020-11.kraken.btc_eur.kraken_rest.trades")
+    TimeInterval('2020-11Z', '2020-12Z')
+    >>> parse_filename_period("2020-11-02T153455.123456000Z.2020-11-03T000000.000000000Z.kraken.btc_eur.kraken_rest.trades")
+    TimeInterval('2020-11-02T15:34:55.123456Z', '2020-11-03Z')
+    """
+
+    parts = name.split(".")
+    if len(parts[0]) > 10:
+        period = f"{parts[0]}.{parts[1]}/{parts[2]}.{parts[3]}"
+    else:
+        period = parts[0]
+    return parse_period(period)
 
 
 class Partition:
@@ -39,6 +68,31 @@ class Partition:
     def period(self):
         return self._period
 
+    @staticmethod
+    def from_path(path: Union[str, PurePath]) -> Optional["Partition"]:
+        """
+        Parse a partition file path, as written by `Partition.path()`. Only the
+        path itself is inspected, the file is never opened. Returns None if the
+        path is not a partition file.
+
+        >>> Partition.from_path("data/trades/year=2020/exchange=kraken/instrument=btc_eur/source=kraken_rest/2020-11-02.kraken.btc_eur.kraken_rest.trades.parquet")
+        Partition('kraken_rest', Market('kraken', 'btc/eur'), TimeInterval('2020-11-02Z', '2020-11-03Z'))
+        >>> Partition.from_path("data/trades/readme.md") is None
+        True
+        """
+
+        match = PARTITION_PATH_REGEX.search(str(path))
+        if not match:
+            return None
+
+        try:
+            period = parse_filename_period(match["name"])
+        except ValueError:
+            return None
+
+        market = Market(match["exchange"], match["instrument"].replace("_", "/"))
+        return Partition(match["source"], market, period)
+
     def with_period(self, new_period: TimeInterval) -> "Partition":
         return Partition(self._source, self._market, new_period)
 
@@ -72,3 +126,7 @@ class Partition:
             self.market,
             self.period,
         )
+
+
+# Predicate selecting the partitions of a query.
+PartitionFilter = Callable[[Partition], bool]
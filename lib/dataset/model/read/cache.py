@@ -0,0 +1,232 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import threading
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+from ..partition import Partition, PartitionFilter
+from ..manifest import (
+    Manifest,
+    PARTITION_GLOB,
+    PARTITION_FIELDS,
+    partition_expression,
+)
+
+# Default number of datasets (data dir + subject) to keep open.
+DEFAULT_MAX_DATASETS = 16
+
+# Default number of files to keep the parsed Parquet footer for.
+DEFAULT_MAX_FOOTERS = 100000
+
+PARTITION_DIR_GLOB = "year=*/exchange=*/instrument=*/source=*"
+
+_DATASET_CACHE = None
+
+
+def dataset_cache() -> "DatasetCache":
+    global _DATASET_CACHE
+    if not _DATASET_CACHE:
+        _DATASET_CACHE = DatasetCache()
+    return _DATASET_CACHE
+
+
+def find_partition_files(
+    path: Path,
+    partition_filter: Optional[PartitionFilter] = None,
+) -> List[Path]:
+    """
+    List the partition files of a subject directory. Files are pruned by the
+    partition filter using only their path, i.e. before any file is opened.
+    """
+
+    files = []
+    for file in sorted(path.glob(PARTITION_GLOB)):
+        partition = Partition.from_path(file)
+        if not partition:
+            continue
+        if partition_filter and not partition_filter(partition):
+            continue
+        files.append(file)
+    return files
+
+
+class _File(NamedTuple):
+    path: str
+    partition: Partition
+    size: int
+    mtime_ns: int
+
+
+class _Listing(NamedTuple):
+    version: Tuple
+    schema: Optional[pa.Schema]
+    files: List[_File]
+
+
+class DatasetCache:
+    """
+    Process-wide cache of the partition files of each dataset (data dir plus
+    subject) and of their parsed Parquet footers, so repeated queries skip
+    file discovery and footer parsing.
+
+    A dataset listing is reused as long as its manifest is unchanged, or (when
+    there is no manifest) as long as the partition directories are unchanged.
+    Footers are keyed by path, size and modification time. Both caches evict
+    the least recently used entries.
+    """
+
+    def __init__(
+        self,
+        max_datasets: int = DEFAULT_MAX_DATASETS,
+        max_footers: int = DEFAULT_MAX_FOOTERS,
+    ):
+        self._max_datasets = max_datasets
+        self._max_footers = max_footers
+        self._listings: "OrderedDict[str, _Listing]" = OrderedDict()
+        self._fragments: "OrderedDict[Tuple, ds.ParquetFileFragment]" = OrderedDict()
+        self._format = ds.ParquetFileFormat()
+        self._filesystems = {
+            False: fs.LocalFileSystem(),
+            True: fs.LocalFileSystem(use_mmap=True),
+        }
+        self._lock = threading.RLock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "footer_hits": 0,
+            "footer_misses": 0,
+            "footer_evictions": 0,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self._fragments.clear()
+
+    def dataset(
+        self,
+        path: Path,
+        partition_filter: Optional[PartitionFilter] = None,
+        memory_map: bool = False,
+    ) -> ds.Dataset:
+        """
+        Get the dataset of a subject directory, containing only the files that
+        match the partition filter. With `memory_map` the files are read using
+        memory-mapped I/O, so repeated reads of hot files are served from the
+        page cache, shared between processes.
+        """
+
+        with self._lock:
+            listing = self._listing(path)
+            if listing.schema is None:
+                return ds.dataset(path, format="parquet")
+
+            files = [
+                file
+                for file in listing.files
+                if not partition_filter or partition_filter(file.partition)
+            ]
+            return ds.FileSystemDataset(
+                [self._fragment(file, memory_map) for file in files],
+                schema=listing.schema,
+                format=self._format,
+                filesystem=self._filesystems[memory_map],
+            )
+
+    def _listing(self, path: Path) -> _Listing:
+        key = str(path.resolve())
+        manifest = Manifest(path)
+        version = self._version(path, manifest)
+
+        listing = self._listings.get(key)
+        if listing and listing.version == version:
+            self._listings.move_to_end(key)
+            self._stats["hits"] += 1
+            return listing
+
+        self._stats["misses"] += 1
+        if manifest.exists():
+            listing = self._listing_from_manifest(manifest, version)
+        else:
+            listing = self._listing_from_files(path, version)
+
+        self._listings[key] = listing
+        self._listings.move_to_end(key)
+        while len(self._listings) > self._max_datasets:
+            self._listings.popitem(last=False)
+            self._stats["evictions"] += 1
+        return listing
+
+    def _version(self, path: Path, manifest: Manifest) -> Tuple:
+        try:
+            stat = manifest.file.stat()
+            return ("manifest", stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+
+        dirs = sorted(path.glob(PARTITION_DIR_GLOB))
+        return ("dirs",) + tuple((str(d), d.stat().st_mtime_ns) for d in dirs)
+
+    def _listing_from_manifest(self, manifest: Manifest, version: Tuple) -> _Listing:
+        files = [
+            _File(
+                str(manifest.path / entry.path),
+                entry.partition,
+                entry.size,
+                entry.mtime_ns,
+            )
+            for entry in manifest.entries()
+        ]
+        return _Listing(version, manifest.schema, files)
+
+    def _listing_from_files(self, path: Path, version: Tuple) -> _Listing:
+        files = []
+        for file in find_partition_files(path):
+            stat = file.stat()
+            partition = Partition.from_path(file)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+            files.append(_File(str(file), partition, size, mtime_ns))  # type: ignore
+
+        schema = None
+        if files:
+            metadata = self._fragment(files[0]).metadata
+            file_schema = metadata.schema.to_arrow_schema()
+            schema = pa.schema(list(file_schema) + PARTITION_FIELDS)
+
+        return _Listing(version, schema, files)
+
+    def _fragment(
+        self,
+        file: _File,
+        memory_map: bool = False,
+    ) -> ds.ParquetFileFragment:
+        key = (file.path, file.size, file.mtime_ns, memory_map)
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self._fragments.move_to_end(key)
+            self._stats["footer_hits"] += 1
+            return fragment
+
+        self._stats["footer_misses"] += 1
+        fragment = self._format.make_fragment(
+            file.path,
+            filesystem=self._filesystems[memory_map],
+            partition_expression=partition_expression(file.path),
+        )
+        fragment.ensure_complete_metadata()
+
+        self._fragments[key] = fragment
+        while len(self._fragments) > self._max_footers:
+            self._fragments.popitem(last=False)
+            self._stats["footer_evictions"] += 1
+        return fragment
+
+    def __repr__(self) -> str:
+        stats = " ".join(f"{key}={value}" for key, value in self.stats().items())
+        return f"<DatasetCache {stats}>"
@@ -1,9 +1,11 @@
 from typing import List, Tuple, Dict, Union, Optional, Callable
-from pandas import Timestamp
+from pandas import Timestamp, Timedelta
 import pyarrow.dataset as ds
+import pyarrow as pa
 import re
 from ..types import TimeInterval, TimestampLike, parse_timestamp
 from ..period import PeriodLike, parse_period
+from ..partition import Partition
 from .result import Result
 
 StrArgsOrList = Union[str, List[str]]
@@ -17,6 +19,8 @@ SOURCE_REGEX = re.compile(rf"(?i){RE_SOURCE}")
 EXCHANGE_REGEX = re.compile(rf"(?i){RE_EXCHANGE}")
 INSTRUMENT_REGEX = re.compile(rf"(?i){RE_INSTRUMENT}")
 
+TIME_TYPE = pa.timestamp("ns", tz="UTC")
+
 SUBJECTS = set(["trades"])
 COLUMNS = {
     "trades": [
@@ -34,6 +38,21 @@ COLUMNS = {
 }
 
 
+def time_scalar(t: Timestamp) -> pa.Scalar:
+    """
+    Convert a timestamp to an Arrow scalar of the same type as the time column.
+    Comparing the column to a typed scalar (rather than a string) allows the
+    Parquet row group statistics to be used to skip row groups.
+
+    >>> time_scalar(parse_timestamp("2020-11-02")).value
+    1604275200000000000
+    >>> time_scalar(parse_timestamp("2020-11-02")).type
+    TimestampType(timestamp[ns, tz=UTC])
+    """
+
+    return pa.scalar(t.value, type=TIME_TYPE)
+
+
 def validate_subject(name: str):
     if name not in SUBJECTS:
         raise ValueError(f"Invalid subject: {repr(name)}")
@@ -90,6 +109,7 @@ class QueryBuilder:
             "start": None,
             "end": None,
         }
+        self._memory_map = False
 
     def build(self) -> "Query":
         exchanges = self._filters["exchanges"]
@@ -110,10 +130,11 @@ class QueryBuilder:
             markets=markets + self._filters["markets"],
             start=self._time["start"],
             end=self._time["end"],
+            memory_map=self._memory_map,
         )
 
-    def run(self) -> Result:
-        return self.build().run()
+    def run(self, stream: bool = False) -> Result:
+        return self.build().run(stream=stream)
 
     def subject(self, name: str) -> "QueryBuilder":
         validate_subject(name)
@@ -153,6 +174,10 @@ class QueryBuilder:
         self._update_time("start", interval.start)
         return self._update_time("end", interval.end)
 
+    def memory_map(self, enabled: bool = True) -> "QueryBuilder":
+        self._memory_map = bool(enabled)
+        return self
+
     def reset(self, *keys: StrArgsOrList) -> "QueryBuilder":
         keys_list = self._args_or_list(keys)
 
@@ -162,6 +187,7 @@ class QueryBuilder:
                 self._filters[key] = []
             for key in self._time.keys():
                 self._time[key] = None
+            self._memory_map = False
             return self
 
         for key in keys_list:
@@ -172,6 +198,8 @@ class QueryBuilder:
                 self._time["end"] = None
             elif key in self._time:
                 self._time[key] = None
+            elif key == "memory_map":
+                self._memory_map = False
             elif key in self._filters:
                 self._filters[key] = []
             else:
@@ -231,6 +259,7 @@ class Query:
         markets: List[str] = [],
         start: Optional[Timestamp] = None,
         end: Optional[Timestamp] = None,
+        memory_map: bool = False,
     ):
         self._subject = subject
         self._columns = columns
@@ -238,14 +267,18 @@ class Query:
         self._markets = markets
         self._start = start
         self._end = end
+        self._memory_map = memory_map
 
-    def run(self) -> Result:
+    def run(self, stream: bool = False) -> Result:
         if not self._subject:
             raise ValueError(f"Query: you must specify the subject")
         return Result(
             subject=self._subject,
             columns=self._columns,
             dataset_filter=self.dataset_filter(),
+            partition_filter=self.matches_partition,
+            stream=stream,
+            memory_map=self._memory_map,
         )
 
     @property
@@ -272,17 +305,60 @@ class Query:
     def end(self) -> Optional[Timestamp]:
         return self._end
 
+    @property
+    def memory_map(self) -> bool:
+        return self._memory_map
+
     @property
     def interval(self) -> Optional[TimeInterval]:
         if self._start and self._end:
             return TimeInterval(self._start, self._end)
         return None
 
+    def matches_partition(self, partition: Partition) -> bool:
+        """
+        Check if a partition can contain records matching this query, using
+        only the partition source, market and period.
+
+        >>> from ..types import Market
+        >>> query = Query(markets=["kraken:btc/eur"], start=parse_timestamp("2020-11-02"))
+        >>> btc_eur = Market("kraken", "btc/eur")
+        >>> query.matches_partition(Partition("kraken_rest", btc_eur, parse_period("2020-11")))
+        True
+        >>> query.matches_partition(Partition("kraken_rest", btc_eur, parse_period("2020-11-01")))
+        False
+        >>> query.matches_partition(Partition("kraken_rest", Market("kraken", "ada/btc"), parse_period("2020-11")))
+        False
+        """
+
+        if self._sources and partition.source not in self._sources:
+            return False
+
+        if self._markets:
+            exchange = partition.market.exchange
+            instrument = partition.market.instrument
+            for market in self._markets:
+                market_exchange, market_instrument = market.split(":", 1)
+                if market_exchange not in ["*", exchange]:
+                    continue
+                if market_instrument not in ["*", instrument]:
+                    continue
+                break
+            else:
+                return False
+
+        if self._start and partition.period.end <= self._start:
+            return False
+        if self._end and partition.period.start >= self._end:
+            return False
+
+        return True
+
     def dataset_filter(self):
         source_filter = None
         for source in self._sources:
             f = ds.field("source") == source
-            if source_filter:
+            if source_filter is not None:
                 source_filter = source_filter | f
             else:
                 source_filter = f
@@ -300,7 +376,7 @@ class Query:
                 f2 = ds.field("instrument") == instrument
                 f = f1 & f2
 
-            if market_filter:
+            if market_filter is not None:
                 market_filter = market_filter | f
             else:
                 market_filter = f
@@ -308,20 +384,20 @@ class Query:
         start_filter = None
         if self._start:
             f1 = ds.field("year") >= self._start.year
-            f2 = ds.field("time") >= self._start.isoformat().replace("+00:00", "Z")
+            f2 = ds.field("time") >= time_scalar(self._start)
             start_filter = f1 & f2
 
         end_filter = None
         if self._end:
-            f1 = ds.field("year") <= self._end.year
-            f2 = ds.field("time") < self._end.isoformat().replace("+00:00", "Z")
+            f1 = ds.field("year") <= (self._end - Timedelta(1)).year
+            f2 = ds.field("time") < time_scalar(self._end)
             end_filter = f1 & f2
 
         combined_filter = None
         for f in [source_filter, market_filter, start_filter, end_filter]:
-            if not f:
+            if f is None:
                 continue
-            if combined_filter:
+            if combined_filter is not None:
                 combined_filter = combined_filter & f
             else:
                 combined_filter = f
@@ -340,6 +416,7 @@ class Query:
             self.interval and f"  interval: {self.interval}",
             not self.interval and self.start and f"  start: {self.start}",
             not self.interval and self.end and f"  end: {self.end}",
+            self.memory_map and "  memory_map: yes",
         ]
         lines = "\n".join([line for line in lines if line])
         return lines and f"<Query>:\n{lines}" or "<Query>: matches all"
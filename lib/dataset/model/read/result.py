@@ -1,14 +1,73 @@
-from typing import List, Optional
+from typing import List, Optional, Iterator
 from pathlib import Path
-import pyarrow.dataset as ds
 import pyarrow as pa
+import pyarrow.compute as pc
 import numpy as np
+from ..partition import PartitionFilter
+from .cache import dataset_cache
 
 # Trades data location.
 ROOT_DIR = (Path(__file__).parent / ".." / ".." / ".." / "..").resolve()
 DATA_DIR = ROOT_DIR / "data"
 
-PARTITIONING = ds.partitioning(field_names=["source", "exchange", "instrument", "year"])
+# Default number of rows per record batch when streaming results.
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+# Default number of record batches to read ahead of the consumer, per file.
+DEFAULT_READAHEAD = 4
+
+# Number of files read ahead of the consumer while streaming results.
+FRAGMENT_READAHEAD = 1
+
+# The readahead of the dataset scanner can be bounded from pyarrow 10.
+PYARROW_VERSION = tuple(int(part) for part in pa.__version__.split(".")[:2])
+
+
+def column_numpy(
+    column: pa.ChunkedArray,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Get the values of a chunked column as a single NumPy array. A column with
+    one chunk and no nulls is returned as a zero-copy view. Otherwise the
+    chunks are copied once, into `out` if given.
+
+    >>> column_numpy(pa.chunked_array([[1, 2], [3]]))
+    array([1, 2, 3])
+    >>> out = np.zeros(3, dtype=np.int64)
+    >>> column_numpy(pa.chunked_array([[1, 2], [3]]), out=out) is out
+    True
+    >>> out
+    array([1, 2, 3])
+    """
+
+    chunks = [chunk.to_numpy(zero_copy_only=False) for chunk in column.iterchunks()]
+    if not chunks:
+        empty = pa.array([], type=column.type).to_numpy(zero_copy_only=False)
+        chunks = [empty]
+
+    if out is None:
+        if len(chunks) == 1:
+            return chunks[0]
+        out = np.empty(len(column), dtype=chunks[0].dtype)
+
+    return np.concatenate(chunks, out=out)
+
+
+def column_min_max(column: pa.ChunkedArray):
+    """
+    >>> column_min_max(pa.chunked_array([[3, 1], [2]]))
+    (1, 3)
+    """
+
+    min_max = pc.min_max(column)
+    return (min_max["min"].as_py(), min_max["max"].as_py())
+
+
+def _float_out(out: Optional[np.ndarray], size: int) -> np.ndarray:
+    if out is None:
+        return np.empty(size, dtype=np.float64)
+    return out
 
 
 class Result:
@@ -17,16 +76,19 @@ class Result:
         subject: str,
         columns: Optional[List[str]] = None,
         dataset_filter=None,
+        partition_filter: Optional[PartitionFilter] = None,
+        stream: bool = False,
+        memory_map: bool = False,
     ):
         self._subject = subject
         self._columns = columns
+        self._filter = dataset_filter
         self._path = DATA_DIR / subject
-        self._dataset = ds.dataset(
-            self._path,
-            format="parquet",
-            partitioning=PARTITIONING,
-        )
-        self._table = self._dataset.to_table(filter=dataset_filter, columns=columns)
+        self._memory_map = memory_map
+        self._dataset = self._open_dataset(partition_filter)
+        self._table: Optional[pa.Table] = None
+        if not stream:
+            self._table = self._dataset.to_table(filter=dataset_filter, columns=columns)
 
     @property
     def subject(self) -> str:
@@ -36,27 +98,98 @@ class Result:
     def columns(self) -> Optional[List[str]]:
         return self._columns
 
+    @property
+    def streaming(self) -> bool:
+        return self._table is None
+
     @property
     def num_rows(self):
-        return len(self._table)
+        return len(self._get_table())
+
+    def iter_batches(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        readahead_size: int = DEFAULT_READAHEAD,
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Iterate over the result as Arrow record batches of at most `batch_size`
+        rows. In streaming mode the batches are read lazily from the dataset
+        scanner, which reads at most `readahead_size` batches ahead of the
+        consumer, of the current file and `FRAGMENT_READAHEAD` next files.
+        Before pyarrow 10, the scanner's own default readahead is used.
+        """
+
+        if self._table is not None:
+            yield from self._table.to_batches(max_chunksize=batch_size)
+            return
+
+        readahead = {}
+        if PYARROW_VERSION >= (10, 0):
+            readahead = dict(
+                batch_readahead=max(readahead_size, 0),
+                fragment_readahead=FRAGMENT_READAHEAD,
+            )
+        yield from self._dataset.to_batches(
+            filter=self._filter,
+            columns=self._columns,
+            batch_size=batch_size,
+            **readahead,
+        )
+
+    def column_numpy(
+        self,
+        name,
+        decimals_as_floats=False,
+        timestamps_as_floats=False,
+        out: Optional[np.ndarray] = None,
+    ):
+        """
+        Get a column as a NumPy array. If the column is stored in a single
+        chunk, a zero-copy (read-only) view is returned whenever no conversion
+        is needed. Pass `out` to write the values into an existing array of the
+        right size and type instead, e.g. to reuse it in a loop.
+        """
 
-    def column_numpy(self, name, decimals_as_floats=False, timestamps_as_floats=False):
-        field = self._table.schema.field(name)
+        table = self._get_table()
+        field = table.schema.field(name)
+        column = table[name]
 
         if isinstance(field.type, pa.TimestampType):
             if timestamps_as_floats:
-                return self._table[name].cast(pa.float64).to_numpy() / 1e9
+                values = column_numpy(column).view(np.int64)
+                return np.divide(values, 1e9, out=_float_out(out, len(values)))
             else:
-                return self._table[name].to_numpy()
+                return column_numpy(column, out=out)
 
         if isinstance(field.type, pa.StructType):
-            series = self._table[name].flatten()
-            if decimals_as_floats:
-                return series[0].to_numpy() / (10.0 ** series[1].to_numpy())
-            else:
-                return series[0].to_numpy()
+            chunks = [chunk.flatten() for chunk in column.iterchunks()]
+            value_type, scale_type = [f.type for f in field.type]
+            value = pa.chunked_array([c[0] for c in chunks], type=value_type)
+            if not decimals_as_floats:
+                return column_numpy(value, out=out)
+
+            scale = pa.chunked_array([c[1] for c in chunks], type=scale_type)
+            values = column_numpy(value)
+            out = _float_out(out, len(values))
+            scale_min, scale_max = column_min_max(scale)
+            if scale_min == scale_max:
+                # The decimal scale is normally constant for a given market.
+                return np.divide(values, 10.0 ** (scale_min or 0), out=out)
+            return np.divide(values, 10.0 ** column_numpy(scale), out=out)
+
+        return column_numpy(column, out=out)
+
+    def _open_dataset(self, partition_filter: Optional[PartitionFilter]):
+        return dataset_cache().dataset(
+            self._path,
+            partition_filter,
+            memory_map=self._memory_map,
+        )
 
-        return self._table[name].to_numpy()
+    def _get_table(self) -> pa.Table:
+        if self._table is None:
+            raise RuntimeError("Result: streaming result, use iter_batches() instead")
+        return self._table
 
     def __len__(self) -> int:
         return self.num_rows
@@ -65,4 +198,6 @@ class Result:
         return repr(self)
 
     def __repr__(self) -> str:
+        if self.streaming:
+            return f"<Result subject={repr(self._subject)} streaming>"
         return f"<Result subject={repr(self._subject)} num_rows={len(self)}>"
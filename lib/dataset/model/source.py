@@ -1,6 +1,7 @@
 from typing import Protocol, Optional, List, Iterator, AsyncIterator
 from abc import abstractmethod
 from pandas import Timestamp, Timedelta
+import numpy as np
 import pyarrow as pa
 import pyarrow.compute as pc
 import asyncio, threading
@@ -23,23 +24,63 @@ class Source(Protocol):
         ...
 
 
+# Number of nanoseconds in a (UTC) day.
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+
+
+def split_series_per_day(series: TableSeries) -> Iterator[TableSeries]:
+    """
+    Split a series into one series per UTC day. The time column is expected
+    to be sorted (it is sorted if not), so the day boundaries are found in a
+    single pass over the int64 nanoseconds, and each day is a zero-copy slice
+    of the table, keeping the column types as is.
+
+    >>> from .partition import Partition
+    >>> table = pa.table(
+    ...     {
+    ...         "time": pa.array(
+    ...             [Timestamp("2020-11-01 22:00"), Timestamp("2020-11-01 23:00"), Timestamp("2020-11-02 01:00")],
+    ...             type=pa.timestamp("ns", tz="UTC"),
+    ...         ),
+    ...         "side": pa.array(["buy", "sell", "buy"], type=pa.dictionary(pa.int8(), pa.string())),
+    ...     }
+    ... )
+    >>> partition = Partition("kraken_rest", Market("kraken", "btc/eur"), TimeInterval("2020-11-01T21:30Z", "2020-11-02T02:00Z"))
+    >>> for day in split_series_per_day(TableSeries(table, partition)):
+    ...     print(day, day.table.schema.field("side").type)
+    <TableSeries kraken_rest:kraken:btc/eur:2020-11-01T21:30Z/2020-11-02Z num_rows=2> dictionary<values=string, indices=int8, ordered=0>
+    <TableSeries kraken_rest:kraken:btc/eur:2020-11-02Z/2020-11-02T02Z num_rows=1> dictionary<values=string, indices=int8, ordered=0>
+    """
+
+    table = series.table
+    if len(table) == 0:
+        return
+
+    time = np.concatenate(
+        [chunk.view(pa.int64()).to_numpy() for chunk in table["time"].iterchunks()]
+    )
+    if (np.diff(time) < 0).any():
+        order = np.argsort(time, kind="stable")
+        table = table.take(pa.array(order))
+        time = time[order]
+
+    days = time // DAY_NS
+    boundaries = np.flatnonzero(np.diff(days)) + 1
+    offsets = [0] + boundaries.tolist() + [len(table)]
+
+    period = series.partition.period
+    for index, (offset, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        day = Timestamp(int(days[offset]) * DAY_NS, tz="UTC")
+        start_time = max(day, period.start) if index == 0 else day
+        end_time = min(day + Timedelta(days=1), period.end)
+
+        partition = series.partition.with_period(TimeInterval(start_time, end_time))
+        yield TableSeries(table.slice(offset, end - offset), partition)
+
+
 async def split_per_day(
     iterator: AsyncIterator[TableSeries],
 ) -> AsyncIterator[TableSeries]:
     async for series in iterator:
-        frame = series.table.to_pandas()
-        start_time = series.partition.period.start
-        for (date, group) in frame.groupby(frame["time"].dt.date):
-            time = Timestamp(date, tz="UTC")
-            if time > start_time:
-                start_time = time
-
-            end_time = time + Timedelta(days=1)
-            if end_time > series.partition.period.end:
-                end_time = series.partition.period.end
-
-            partition = series.partition.with_period(TimeInterval(start_time, end_time))
-            start_time = time
-
-            table = pa.Table.from_pandas(group).drop(["__index_level_0__"])
-            yield TableSeries(table, partition)
+        for day_series in split_series_per_day(series):
+            yield day_series
@@ -183,6 +183,10 @@ class TimeInterval(Interval):
 
         return len(start) <= 11 and self.end == self.start + DateOffset(days=1)
 
+    def __reduce__(self):
+        # Pickled by start and end, e.g. to be sent to a worker process.
+        return (TimeInterval, (self.start, self.end))
+
     def __str__(self) -> str:
         return f"{format_timestamp(self.left)}/{format_timestamp(self.right)}"
 
@@ -1,13 +1,26 @@
-from typing import Optional
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
 from pathlib import Path
 from pandas import Timestamp, Timedelta
 from secrets import token_hex
+import asyncio
+import os
 import re
+import time
 import pyarrow as pa
 import pyarrow.parquet as pq
 from ..source import Source, split_per_day
 from ..period import parse_period
-from ..partition import Partition
+from ..partition import Partition, parse_filename_period
+from ..manifest import Manifest
+from ..journal import Journal
+from ..series import TableSeries
 from ..types import Market, TimeInterval
 
 PARQUET_WRITE_ARGS = {
@@ -16,6 +29,19 @@ PARQUET_WRITE_ARGS = {
     "data_page_version": "2.0",
 }
 
+# Number of items buffered between the stages of write_trades, which is also
+# the maximum number of tables being encoded at the same time per market.
+PIPELINE_QUEUE_SIZE = 4
+
+# Limits of the write buffer of write_trades, after which the buffered trades
+# of a day are written to a file.
+WRITE_BUFFER_ROWS = 1000000
+WRITE_BUFFER_BYTES = 128 * 1024 * 1024
+WRITE_BUFFER_AGE = 60.0
+
+# Number of rows per row group of the files merged by index_path.
+COMPACT_ROW_GROUP_SIZE = 1000000
+
 HIVE_PARTITION_REGEX = re.compile(
     r"/trades/year=(?P<year>\d{4})/exchange=(?P<exchange>[\w\-]+)/instrument=(?P<instrument>[\w\-]+)/source=(?P<source>[\w\-]+)\Z"
 )
@@ -31,36 +57,439 @@ def write_table(table: pa.Table, path: Path):
     tmp_path.rename(path)
 
 
+def compact_files(
+    files: List[Path], path: Path, row_group_size: int = COMPACT_ROW_GROUP_SIZE
+):
+    """
+    Merge parquet files into one, streaming row groups from the input files
+    into row groups of `row_group_size` rows, so that at most a few row groups
+    are held in memory, however many rows the files have together. The files
+    may differ in schema as far as it can be unified, e.g. a column of nulls
+    in one file and of strings in another.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     files = [Path(tmp) / f"{i}.parquet" for i in range(3)]
+    ...     for i, file in enumerate(files):
+    ...         pq.write_table(pa.table({"n": range(i * 3, i * 3 + 3)}), file)
+    ...     compact_files(files, Path(tmp) / "all.parquet", row_group_size=4)
+    ...     parquet_file = pq.ParquetFile(Path(tmp) / "all.parquet")
+    ...     [parquet_file.metadata.row_group(i).num_rows for i in range(3)]
+    ...     parquet_file.read()["n"].to_pylist()
+    [4, 4, 1]
+    [0, 1, 2, 3, 4, 5, 6, 7, 8]
+    """
+
+    schema = pa.unify_schemas([pq.read_schema(file) for file in files])
+    tmp_path = path.with_name(f"{path.name}.new_{token_hex(6)}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    buffer: List[pa.Table] = []
+    buffer_rows = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema, **PARQUET_WRITE_ARGS) as writer:
+            for file in files:
+                parquet_file = pq.ParquetFile(file)
+                for i in range(parquet_file.num_row_groups):
+                    table = parquet_file.read_row_group(i)
+                    buffer.append(table.cast(schema))
+                    buffer_rows += table.num_rows
+                    if buffer_rows < row_group_size:
+                        continue
+
+                    table = pa.concat_tables(buffer)
+                    offset = 0
+                    while table.num_rows - offset >= row_group_size:
+                        writer.write_table(table.slice(offset, row_group_size))
+                        offset += row_group_size
+                    buffer = [table.slice(offset)]
+                    buffer_rows = table.num_rows - offset
+
+            if buffer_rows:
+                writer.write_table(pa.concat_tables(buffer))
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    tmp_path.rename(path)
+
+
+class IndexStats:
+    """
+    Number of files read, written and removed by indexing (and the size of the
+    files read and written), per worker process.
+
+    >>> stats = IndexStats(worker=1, num_files_read=3, bytes_read=3 * 1024 ** 2)
+    >>> stats += IndexStats(worker=1, num_files_written=1, bytes_written=1024 ** 2)
+    >>> stats
+    <IndexStats worker=1 partitions=2 read=3/3.0MiB written=1/1.0MiB removed=0>
+    """
+
+    def __init__(
+        self,
+        worker: int,
+        num_partitions: int = 1,
+        num_files_read: int = 0,
+        bytes_read: int = 0,
+        num_files_written: int = 0,
+        bytes_written: int = 0,
+        num_files_removed: int = 0,
+    ):
+        self.worker = worker
+        self.num_partitions = num_partitions
+        self.num_files_read = num_files_read
+        self.bytes_read = bytes_read
+        self.num_files_written = num_files_written
+        self.bytes_written = bytes_written
+        self.num_files_removed = num_files_removed
+
+    def __add__(self, other: "IndexStats") -> "IndexStats":
+        return IndexStats(
+            self.worker,
+            self.num_partitions + other.num_partitions,
+            self.num_files_read + other.num_files_read,
+            self.bytes_read + other.bytes_read,
+            self.num_files_written + other.num_files_written,
+            self.bytes_written + other.bytes_written,
+            self.num_files_removed + other.num_files_removed,
+        )
+
+    def __repr__(self) -> str:
+        mib_read = self.bytes_read / 1024 ** 2
+        mib_written = self.bytes_written / 1024 ** 2
+        return (
+            f"<IndexStats worker={self.worker} partitions={self.num_partitions}"
+            f" read={self.num_files_read}/{mib_read:.1f}MiB"
+            f" written={self.num_files_written}/{mib_written:.1f}MiB"
+            f" removed={self.num_files_removed}>"
+        )
+
+
+def index_partition(
+    data_dir: Path,
+    path: Path,
+    subject: str,
+    partition: Partition,
+    periods: Optional[List[TimeInterval]] = None,
+) -> IndexStats:
+    """
+    Index a partition directory, in a worker process of `DatasetWriter.index`.
+    """
+
+    writer = DatasetWriter(str(data_dir))
+    return writer.index_path_sync(path, subject, partition, periods)
+
+
+class WriteBuffer:
+    """
+    Accumulates consecutive series of the same partition and day, so they are
+    written as one file instead of one file per page. Buffered series are
+    merged and handed back for writing when a new day (or partition) starts,
+    when the buffer exceeds a number of rows or bytes, when its oldest series
+    was added more than `max_age` seconds ago, and on `flush()`.
+
+    Buffered series are not on disk yet, but the download resumes from the
+    files on disk, so after a crash they are simply downloaded again.
+
+    >>> from .. import partition as p
+    >>> def series(start, end, num_rows):
+    ...     period = TimeInterval(start, end)
+    ...     partition = p.Partition("kraken_rest", Market("kraken", "btc/eur"), period)
+    ...     return TableSeries(pa.table({"price": [1] * num_rows}), partition)
+    >>> buffer = WriteBuffer(max_rows=5)
+    >>> buffer.add(series("2020-11-01T10:00Z", "2020-11-01T11:00Z", 2))
+    []
+    >>> buffer.add(series("2020-11-01T11:00Z", "2020-11-01T12:00Z", 2))
+    []
+    >>> [str(s) for s in buffer.add(series("2020-11-02T00:00Z", "2020-11-02T01:00Z", 2))]
+    ['<TableSeries kraken_rest:kraken:btc/eur:2020-11-01T10Z/2020-11-01T12Z num_rows=4>']
+    >>> [str(s) for s in buffer.add(series("2020-11-02T01:00Z", "2020-11-02T02:00Z", 3))]
+    ['<TableSeries kraken_rest:kraken:btc/eur:2020-11-02Z/2020-11-02T02Z num_rows=5>']
+    >>> buffer.flush()
+    []
+    """
+
+    def __init__(
+        self,
+        max_rows: int = WRITE_BUFFER_ROWS,
+        max_bytes: int = WRITE_BUFFER_BYTES,
+        max_age: float = WRITE_BUFFER_AGE,
+    ):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._key: Optional[Tuple] = None
+        self._series: List[TableSeries] = []
+        self._num_rows = 0
+        self._num_bytes = 0
+        self._since = 0.0
+
+    def add(self, series: TableSeries) -> List[TableSeries]:
+        """
+        Add a series, returning the series to write now, if any.
+        """
+
+        partition = series.partition
+        key = (partition.source, str(partition.market), partition.period.start.date())
+        flushed = self.flush() if key != self._key else []
+
+        if not self._series:
+            self._key = key
+            self._since = time.monotonic()
+        self._series.append(series)
+        self._num_rows += series.num_rows
+        self._num_bytes += series.table.nbytes
+
+        if (
+            self._num_rows >= self.max_rows
+            or self._num_bytes >= self.max_bytes
+            or time.monotonic() - self._since >= self.max_age
+        ):
+            flushed += self.flush()
+        return flushed
+
+    def flush(self) -> List[TableSeries]:
+        """
+        Empty the buffer, returning the buffered series merged into one.
+        """
+
+        if not self._series:
+            return []
+
+        first, last = self._series[0], self._series[-1]
+        if len(self._series) == 1:
+            series = first
+        else:
+            start, end = first.partition.period.start, last.partition.period.end
+            series = TableSeries(
+                pa.concat_tables([s.table for s in self._series]),
+                first.partition.with_period(TimeInterval(start, end)),
+            )
+
+        self._key = None
+        self._series = []
+        self._num_rows = 0
+        self._num_bytes = 0
+        return [series]
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+
+async def _pipe(iterator: AsyncIterator, queue: asyncio.Queue):
+    """
+    Run a pipeline stage: put the items of an async iterator into a bounded
+    queue, followed by `None`, or by the error that stopped the iterator.
+    """
+
+    try:
+        async for item in iterator:
+            await queue.put((item, None))
+        await queue.put((None, None))
+    except asyncio.CancelledError:
+        raise
+    except Exception as error:
+        await queue.put((None, error))
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose:
+            await aclose()
+
+
+async def _drain(queue: asyncio.Queue) -> AsyncIterator:
+    while True:
+        item, error = await queue.get()
+        if error:
+            raise error
+        if item is None:
+            return
+        yield item
+
+
 class DatasetWriter:
-    def __init__(self, path: str):
+    def __init__(
+        self,
+        path: str,
+        executor: Optional[Executor] = None,
+        buffer_rows: int = WRITE_BUFFER_ROWS,
+        buffer_bytes: int = WRITE_BUFFER_BYTES,
+        buffer_age: float = WRITE_BUFFER_AGE,
+    ):
         self._path = Path(path).resolve()
+        self._manifests: Dict[str, Manifest] = {}
+        self._journals: Dict[str, Journal] = {}
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._buffer_limits = (buffer_rows, buffer_bytes, buffer_age)
 
     @property
     def path(self) -> Path:
         return self._path
 
+    def manifest(self, subject: str) -> Manifest:
+        # One manifest per subject, shared by concurrent downloads, so updates
+        # of one market never overwrite those of another.
+        if subject not in self._manifests:
+            self._manifests[subject] = Manifest(self._path / subject)
+        return self._manifests[subject]
+
+    def journal(self, subject: str) -> Journal:
+        if subject not in self._journals:
+            self._journals[subject] = Journal(self._path / subject)
+        return self._journals[subject]
+
+    def close(self):
+        if self._owns_executor and self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
     async def write_trades(self, market: str, source: Source, **kwargs):
+        """
+        Download and write the trades of a market since the last download.
+
+        Fetching and decoding pages, splitting them per day and encoding the
+        Parquet files run as overlapping stages, connected by bounded queues.
+        Parquet encoding runs on a thread pool, so the next pages are fetched
+        while the previous ones are compressed and written.
+
+        Pages are collected in a write buffer and written as one file per day,
+        unless the buffer limits are reached before the day is complete.
+        """
+
         partition = None
         index_paths = set()
+        manifest = self.manifest("trades")
+        journal = self.journal("trades")
         since = self._get_since("trades", market)
-        async for series in split_per_day(source.trades(market, since=since, **kwargs)):
-            if not partition:
-                partition = series.partition
+
+        loop = asyncio.get_running_loop()
+        pages: asyncio.Queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        days: asyncio.Queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        stages = [
+            asyncio.create_task(
+                _pipe(source.trades(market, since=since, **kwargs), pages)
+            ),
+            asyncio.create_task(_pipe(split_per_day(_drain(pages)), days)),
+        ]
+        buffer = WriteBuffer(*self._buffer_limits)
+        writes: Deque = deque()
+
+        # Directories of finished writes, added to the manifest by one refresh
+        # at a time on the executor, so the event loop never waits on the
+        # manifest and refreshes are batched while one is running.
+        refresh_dirs: Set[Path] = set()
+        refreshing: Optional["asyncio.Future[None]"] = None
+
+        def refresh_manifest():
+            nonlocal refreshing
+            if refreshing is not None and refreshing.done():
+                refreshing.result()
+                refreshing = None
+            if refresh_dirs and refreshing is None:
+                dirs = sorted(refresh_dirs)
+                refresh_dirs.clear()
+                refreshing = loop.run_in_executor(
+                    self._get_executor(), manifest.refresh, *dirs
+                )
+
+        # Each write starts once the previous one is written, and not at all
+        # if it failed, so the files on disk are always a run of days without
+        # gaps and the next download resumes from the first missing day.
+        failed = False
+
+        async def write_after(previous, table: pa.Table, path: Path):
+            if previous is not None:
+                await previous
+            await loop.run_in_executor(self._get_executor(), write_table, table, path)
+
+        def start_write(series: TableSeries):
             path = self._path / series.partition.path("trades")
             index_paths.add(path.parent)
-            write_table(series.table, path)
+            journal.append(path.parent, series.partition.period)
+            previous = writes[-1][2] if writes else None
+            write = asyncio.ensure_future(write_after(previous, series.table, path))
+            writes.append((series, path, write))
+
+        async def finish_write():
+            nonlocal failed
+            series, path, write = writes.popleft()
+            try:
+                await write
+            except Exception:
+                failed = True
+                raise
+            refresh_dirs.add(path.parent)
+            refresh_manifest()
             print(series)
 
+        try:
+            async for series in _drain(days):
+                if not partition:
+                    partition = series.partition
+                for buffered_series in buffer.add(series):
+                    start_write(buffered_series)
+                while len(writes) >= PIPELINE_QUEUE_SIZE:
+                    await finish_write()
+
+            for buffered_series in buffer.flush():
+                start_write(buffered_series)
+            while writes:
+                await finish_write()
+        finally:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+
+            # On download errors, still write what was downloaded before the
+            # error. After a failed write, the writes after it fail with it.
+            if not failed:
+                for buffered_series in buffer.flush():
+                    start_write(buffered_series)
+            while writes:
+                path = writes[0][1]
+                skipped = failed
+                try:
+                    await finish_write()
+                except Exception as error:
+                    if skipped:
+                        print(f"- WRITE SKIPPED: {path}")
+                    else:
+                        print(f"- WRITE FAILED: {path}: {error!r}")
+
+            while refreshing is not None or refresh_dirs:
+                if refreshing is not None:
+                    await asyncio.wait([refreshing])
+                refresh_manifest()
+
         for index_path in index_paths:
             await self.index_path(index_path, "trades", partition)  # type: ignore
 
-    async def index(self):
-        hive_pattern = "trades/year=*/exchange=*/instrument=*/source=*/*.parquet"
-        index_paths = set()
-        for file in self._path.glob(hive_pattern):
-            index_paths.add(file.parent)
+    async def index(self, workers: int = 1, full: bool = False):
+        """
+        Index the partition directories written since the last index, as
+        logged in the journal, and only the day, month or year files of the
+        periods that were written. With `full`, all directories are indexed
+        entirely instead.
+
+        With more than one worker, the directories are indexed in parallel by
+        a pool of worker processes. Progress is reported per directory,
+        followed by the number of files and bytes each worker read and wrote.
+        """
+
+        journal = self.journal("trades")
+        dirty_paths = journal.take()
+
+        index_paths: Dict[Path, Optional[List[TimeInterval]]] = {}
+        if full:
+            hive_pattern = "trades/year=*/exchange=*/instrument=*/source=*/*.parquet"
+            for file in self._path.glob(hive_pattern):
+                index_paths[file.parent] = None
+        else:
+            for index_path, periods in dirty_paths.items():
+                if index_path.is_dir():
+                    index_paths[index_path] = periods
 
-        for index_path in index_paths:
+        partitions = []
+        for index_path in sorted(index_paths.keys()):
             match = HIVE_PARTITION_REGEX.search(str(index_path))
             if not match:
                 continue
@@ -70,10 +499,75 @@ class DatasetWriter:
                 Market(match["exchange"], match["instrument"]),
                 parse_period(match["year"]),
             )
-            await self.index_path(index_path, "trades", partition)
+            partitions.append((index_path, partition, index_paths[index_path]))
+
+        pool: Executor = (
+            ProcessPoolExecutor(workers) if workers > 1 else ThreadPoolExecutor(1)
+        )
+        worker_stats: Dict[int, IndexStats] = {}
+        futures: List["Future[IndexStats]"] = []
+        try:
+            futures = [
+                pool.submit(
+                    index_partition,
+                    self._path,
+                    path,
+                    "trades",
+                    partition,
+                    periods,
+                )
+                for path, partition, periods in partitions
+            ]
+            tasks = [asyncio.wrap_future(future) for future in futures]
+            for i, task in enumerate(asyncio.as_completed(tasks)):
+                stats = await task
+                if stats.worker in worker_stats:
+                    stats = worker_stats[stats.worker] + stats
+                worker_stats[stats.worker] = stats
+                print(f"INDEXED {i + 1}/{len(tasks)} partitions")
+        finally:
+            # Cancel the partitions not started yet, before waiting for the
+            # running ones (`shutdown(cancel_futures=True)` needs Python 3.9).
+            for future in futures:
+                future.cancel()
+            pool.shutdown()
+
+        for stats in worker_stats.values():
+            print(stats)
+
+        manifest = self.manifest("trades")
+        if full:
+            manifest.rebuild()
+        elif partitions or not manifest.exists():
+            manifest.refresh(*[path for path, _, _ in partitions])
+        journal.commit()
 
     async def index_path(self, path: Path, subject: str, partition: Partition):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._get_executor(), self.index_path_sync, path, subject, partition
+        )
+        await loop.run_in_executor(
+            self._get_executor(), self.manifest(subject).refresh, path
+        )
+
+    def index_path_sync(
+        self,
+        path: Path,
+        subject: str,
+        partition: Partition,
+        periods: Optional[List[TimeInterval]] = None,
+    ) -> IndexStats:
+        """
+        Index a partition directory: merge its files into daily, monthly and
+        yearly files and remove the files shadowed by them. If `periods` are
+        given, only the day, month or year files overlapping them are merged.
+        The manifest is not refreshed, so partitions can be indexed in
+        parallel processes.
+        """
+
         print(f"INDEXING {path}:")
+        stats = IndexStats(worker=os.getpid())
         full_period = None
         shadow_file = None
         files_to_index = {}
@@ -151,9 +645,15 @@ class DatasetWriter:
                     print(f"- NOT REMOVING (OUTSIDE SHADOW): {file.stem}")
                     continue
                 file.unlink(missing_ok=True)
+                stats.num_files_removed += 1
                 print(f"- REMOVED: {file.stem}")
 
         for index_period, files in files_to_index.items():
+            if periods is not None and not any(
+                parse_period(index_period).overlaps(period) for period in periods
+            ):
+                continue
+
             file_period = TimeInterval(index_period, files[-1][0].end)
             filename = self._path / partition.with_period(file_period).path(
                 subject,
@@ -168,12 +668,32 @@ class DatasetWriter:
                     print(f"- INDEXED (RENAME): {filename.stem}")
                 continue
 
-            table = pa.concat_tables([pq.read_table(file) for period, file in files])
-            write_table(table, filename)
+            stats.bytes_read += sum(file.stat().st_size for period, file in files)
+            compact_files([file for period, file in files], filename)
+            stats.bytes_written += filename.stat().st_size
+            stats.num_files_read += len(files)
+            stats.num_files_written += 1
             print(f"- INDEXED: {filename.stem}")
 
+        return stats
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor()
+        return self._executor
+
     def _get_since(self, subject: str, market: str) -> Optional[Timestamp]:
         exchange, instrument = market.split(":", 1)
+
+        manifest = self.manifest(subject)
+        if manifest.exists():
+            ends = [
+                entry.period_end
+                for entry in manifest.entries()
+                if entry.exchange == exchange and entry.instrument == instrument
+            ]
+            return Timestamp(max(ends), tz="UTC") if ends else None
+
         path_pattern = f"{subject}/year=*/exchange={exchange}/instrument={instrument.replace('/', '_')}/source=*/*.parquet"
 
         paths = sorted(self._path.glob(path_pattern))
@@ -183,12 +703,7 @@ class DatasetWriter:
         return self._get_filename_period(paths[-1].stem).end
 
     def _get_filename_period(self, name: str) -> TimeInterval:
-        parts = name.split(".")
-        if len(parts[0]) > 10:
-            period = f"{parts[0]}.{parts[1]}/{parts[2]}.{parts[3]}"
-        else:
-            period = parts[0]
-        return parse_period(period)
+        return parse_filename_period(name)
 
 
 if __name__ == "__main__":
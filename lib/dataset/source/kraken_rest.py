@@ -1,12 +1,13 @@
+import numpy as np
 import pyarrow as pa
 from pandas import Timestamp
 from decimal import Decimal
-from typing import Optional
+from typing import Dict, Optional, Sequence
 import random
 import time
 import json
 import asyncio
-from ..infrastructure.request import request_context, request_client
+from ..infrastructure.request import request_context, request_client, rate_limiter
 from ..model.series import TableSeries
 from ..model.partition import Partition
 from ..model.types import Market, TimeInterval
@@ -16,6 +17,8 @@ DEFAULT_TIMEOUT = 15
 DEFAULT_WAIT_TIME = 3
 API_VERSION = "0"
 EXCHANGE_SYMBOL = "kraken"
+RATE_LIMIT_ERROR = "EAPI:Rate limit exceeded"
+RATE_LIMIT_RESPONSE = {"error": [RATE_LIMIT_ERROR], "result": {}}
 SOURCE_SYMBOL = "kraken_rest"
 
 # -- Fix asset symbols according to Cryptowatch API --
@@ -38,6 +41,18 @@ ORDER_TYPES = {
 
 # -- Maximum number of decimals for time stored in a 64-bit float --
 TIME_FLOAT_FORMAT = Decimal("0.00000")
+TIME_DECIMALS = 5
+
+# -- Arrow types of the trade columns --
+TIME_TYPE = pa.timestamp("ns", tz="UTC")
+SYMBOL_TYPE = pa.dictionary(pa.int8(), pa.string())
+
+# -- Limits of the vectorized decimal parser, beyond which Decimal is used --
+# Decimal rounds to 28 significant digits, and 10 ** 18 is the largest power
+# of ten of which nine times still fits in an uint64.
+MAX_DECIMAL_LENGTH = 28
+MAX_DECIMAL_EXPONENT = 18
+POWERS_OF_TEN = 10 ** np.arange(MAX_DECIMAL_EXPONENT + 1, dtype=np.uint64)
 
 
 def fix_asset(symbol):
@@ -50,6 +65,177 @@ def fix_time(time_float):
     return Timestamp(nanoseconds, tz="UTC")
 
 
+def decode_fixed(values: Sequence[str], scale: int) -> np.ndarray:
+    """
+    Parse decimal strings into fixed-point integers with `scale` decimals,
+    truncating any further decimals. This gives the same result as
+    `int(Decimal(n).normalize().scaleb(scale))` for each value, but works on
+    the bytes of all strings at once. Values that are not plain decimals, or
+    that are too long or too large, are parsed with Decimal instead.
+
+    >>> decode_fixed(["16543.1", "0.00012345", "7", "2.", ".5"], 5)
+    array([1654310000,         12,     700000,     200000,      50000],
+          dtype=uint64)
+    >>> decode_fixed(["1e3"], 2)
+    array([100000], dtype=uint64)
+    >>> decode_fixed(["-1"], 2)
+    Traceback (most recent call last):
+    ...
+    OverflowError: can't convert negative value to unsigned int
+    """
+
+    def decode_scalar():
+        # Through pyarrow, as numpy would wrap negative values silently.
+        return pa.array(
+            [int(Decimal(n).normalize().scaleb(scale)) for n in values],
+            type=pa.uint64(),
+        ).to_numpy()
+
+    if not all(isinstance(n, str) for n in values):
+        return decode_scalar()
+    try:
+        chars = np.array(values, dtype=np.bytes_)
+    except UnicodeEncodeError:
+        return decode_scalar()
+
+    length = chars.dtype.itemsize
+    if length > MAX_DECIMAL_LENGTH:
+        return decode_scalar()
+
+    # One row per value, one column per character, padded with zeros.
+    matrix = chars.view(np.uint8).reshape(len(chars), length)
+    digit = (matrix >= ord("0")) & (matrix <= ord("9"))
+    dot = matrix == ord(".")
+    pad = matrix == 0
+    plain = (
+        (digit | dot | pad).all()
+        and (dot.sum(axis=1) <= 1).all()
+        and digit.any(axis=1).all()
+        and (np.diff(pad.view(np.int8), axis=1) >= 0).all()
+    )
+    if not plain:
+        return decode_scalar()
+
+    # Power of ten of each digit after scaling, e.g. for "12.34" with scale 1:
+    # 2, 1, -, 0, -1. Digits with a negative exponent are truncated.
+    column = np.arange(length)
+    point = np.where(dot.any(axis=1), dot.argmax(axis=1), length - pad.sum(axis=1))
+    point = point[:, np.newaxis]
+    exponent = scale + point - column - (column < point)
+    used = digit & (exponent >= 0)
+    if (exponent[used] > MAX_DECIMAL_EXPONENT).any():
+        return decode_scalar()
+
+    weights = POWERS_OF_TEN[np.clip(exponent, 0, MAX_DECIMAL_EXPONENT)]
+    weights[~used] = 0
+    digits = matrix.astype(np.uint64) - ord("0")
+    return (digits * weights).sum(axis=1, dtype=np.uint64)
+
+
+def decode_time(values: Sequence[float]) -> np.ndarray:
+    """
+    Convert float seconds into nanoseconds, rounded to 5 decimals like
+    `fix_time`. The rounding is done in floating point, except for values so
+    close to a tie that floating point might round them differently than
+    Decimal, which go through `fix_time`.
+
+    >>> decode_time([1605000000.1234, 1605000000, 1605000000.123455])
+    array([1605000000123400000, 1605000000000000000, 1605000000123460000])
+    """
+
+    if not all(isinstance(n, (float, int)) for n in values):
+        return np.array([fix_time(n).value for n in values], dtype=np.int64)
+
+    scaled = np.array(values, dtype=np.float64) * 10 ** TIME_DECIMALS
+    with np.errstate(invalid="ignore"):
+        # Floating point multiplication is off by at most half an ulp, which
+        # only matters for the rounding direction close to a tie.
+        ulp = np.spacing(np.abs(scaled))
+        tie_distance = np.abs(scaled - np.floor(scaled) - 0.5)
+        exact = (np.abs(scaled) < 2 ** 49) & (tie_distance > ulp)
+
+    nanoseconds = np.zeros(len(scaled), dtype=np.int64)
+    nanoseconds[exact] = np.rint(scaled[exact]).astype(np.int64)
+    nanoseconds[exact] *= 10 ** (9 - TIME_DECIMALS)
+    for index in np.flatnonzero(~exact):
+        nanoseconds[index] = fix_time(values[index]).value
+    return nanoseconds
+
+
+def decode_symbols(values: Sequence[str], symbols: Dict[str, str]) -> pa.Array:
+    """
+    Map raw symbols to a dictionary array, with nulls for unknown symbols.
+    Only the distinct raw symbols are looked up.
+
+    >>> decode_symbols(["s", "b", "s"], TAKER_SIDES).to_pylist()
+    ['sell', 'buy', 'sell']
+    >>> decode_symbols(["s", "x"], TAKER_SIDES).to_pylist()
+    ['sell', None]
+    """
+
+    def decode_scalar():
+        return pa.array([symbols.get(n) for n in values], type=SYMBOL_TYPE)
+
+    try:
+        encoded = pa.array(values, type=pa.string()).dictionary_encode()
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return decode_scalar()
+
+    mapped = [symbols.get(n) for n in encoded.dictionary.to_pylist()]
+    if None in mapped or len(set(mapped)) < len(mapped):
+        return decode_scalar()
+
+    return pa.DictionaryArray.from_arrays(
+        encoded.indices.cast(pa.int8()),
+        pa.array(mapped, type=pa.string()),
+    )
+
+
+def decode_trades(raw_trades, price_scale: int, amount_scale: int) -> pa.Table:
+    """
+    Decode a page of raw Kraken trades into a table.
+
+    >>> decode_trades(
+    ...     [["16543.10000", "0.01000000", 1605000000.1234, "b", "l", ""]], 1, 8
+    ... ).to_pylist()[0]["price"]
+    165431
+    """
+
+    raw_price, raw_amount, raw_time, raw_side, raw_order, raw_misc = (
+        zip(*raw_trades) if raw_trades else [[], [], [], [], [], []]
+    )
+    side = decode_symbols(raw_side, TAKER_SIDES)
+    order = decode_symbols(raw_order, ORDER_TYPES)
+
+    # Only the few trades with unknown symbols or misc info get extra JSON.
+    unknown_side = side.is_null().to_numpy(zero_copy_only=False)
+    unknown_order = order.is_null().to_numpy(zero_copy_only=False)
+    has_misc = np.array(raw_misc, dtype=object).astype(bool)
+
+    extra_json = [None] * len(raw_trades)
+    for index in np.flatnonzero(unknown_side | unknown_order | has_misc):
+        entry = {}
+        if unknown_side[index]:
+            entry["side"] = raw_side[index]
+        if unknown_order[index]:
+            entry["order"] = raw_order[index]
+        if raw_misc[index]:
+            entry["misc"] = raw_misc[index]
+        extra_json[index] = json.dumps({SOURCE_SYMBOL: entry})
+
+    return pa.Table.from_arrays(
+        [
+            pa.array(decode_time(raw_time), type=TIME_TYPE),
+            pa.array(decode_fixed(raw_price, price_scale), type=pa.uint64()),
+            pa.array(decode_fixed(raw_amount, amount_scale), type=pa.uint64()),
+            side,
+            order,
+            pa.array(extra_json, type=pa.string()),
+        ],
+        names=["time", "price", "amount", "side", "order", "extra_json"],
+    )
+
+
 class KrakenRESTSource:
     """
     Connects to Kraken REST API to download trading data.
@@ -116,48 +302,15 @@ class KrakenRESTSource:
 
         price_scale = pair["pair_decimals"]
         amount_scale = pair["lot_decimals"]
-
-        raw_price, raw_amount, raw_time, raw_side, raw_order, raw_misc = (
-            zip(*raw_trades) if raw_trades else [[], [], [], [], [], []]
-        )
-        price = [int(Decimal(n).normalize().scaleb(price_scale)) for n in raw_price]
-        amount = [int(Decimal(n).normalize().scaleb(amount_scale)) for n in raw_amount]
-        time = [fix_time(n) for n in raw_time]
-        side = [TAKER_SIDES.get(n) for n in raw_side]
-        order = [ORDER_TYPES.get(n) for n in raw_order]
-
-        extra_json = []
-        for index, s, o in zip(range(len(raw_trades)), side, order):
-            entry = {}
-            if s == None:
-                entry["side"] = raw_side[index]
-            if o == None:
-                entry["order"] = raw_order[index]
-            if raw_misc[index]:
-                entry["misc"] = raw_misc[index]
-
-            if len(entry.keys()) > 0:
-                extra_json.append(json.dumps({SOURCE_SYMBOL: entry}))
-            else:
-                extra_json.append(None)
+        table = decode_trades(raw_trades, price_scale, amount_scale)
 
         pagination_next = Timestamp(int(result["last"]), tz="UTC")
+        if not since:
+            since = Timestamp(table["time"][0].value, tz="UTC")
         partition = Partition(
             source=SOURCE_SYMBOL,
             market=Market(EXCHANGE_SYMBOL, instrument),
-            period=TimeInterval(since or time[0], pagination_next),
-        )
-
-        table = pa.Table.from_arrays(
-            [
-                pa.array(time, type=pa.timestamp("ns", tz="UTC")),
-                pa.array(price, type=pa.uint64()),
-                pa.array(amount, type=pa.uint64()),
-                pa.array(side, type=pa.dictionary(pa.int8(), pa.string())),
-                pa.array(order, type=pa.dictionary(pa.int8(), pa.string())),
-                pa.array(extra_json, type=pa.string()),
-            ],
-            names=["time", "price", "amount", "side", "order", "extra_json"],
+            period=TimeInterval(since, pagination_next),
         )
 
         return TableSeries(table, partition)
@@ -196,10 +349,7 @@ class KrakenRESTSource:
     # TODO: Refactor back-off algorithm to request module
     async def _request_backoff(self, method: str, data={}, tries=3, current_try=0):
         if not self._client:
-            self._client = request_client(
-                throttle_wait=DEFAULT_WAIT_TIME,
-                timeout=DEFAULT_TIMEOUT,
-            )
+            self._client = request_client(timeout=DEFAULT_TIMEOUT)
 
         try:
             return await self._request_single(method, data)
@@ -213,7 +363,7 @@ class KrakenRESTSource:
             # Back-off wait time and try again.
             wait_time = DEFAULT_WAIT_TIME * (random.random() + 2 ** current_try)
             await asyncio.sleep(wait_time)
-            return await self.request(
+            return await self._request_backoff(
                 method=method,
                 data=data,
                 tries=tries,
@@ -227,6 +377,8 @@ class KrakenRESTSource:
         error = response["error"]
         if error:
             error_message = "; ".join(error) if isinstance(error, list) else str(error)
+            if RATE_LIMIT_ERROR in error_message:
+                rate_limiter(url).exhaust()  # type: ignore
             raise RuntimeError(f"{SOURCE_SYMBOL}: {error_message}")
 
         return response["result"]
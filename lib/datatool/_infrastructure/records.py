@@ -1,25 +1,176 @@
 import pyarrow.parquet as pq
+import pyarrow.compute as pc
 import pyarrow as pa
+import pandas
+import fcntl, re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
 from secrets import token_hex
-from typing import Iterator, Optional, List
-from ..model.types import SubjectSymbol, FileId
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    List,
+    Set,
+    Tuple,
+    Union,
+)
+from ..model.types import (
+    SubjectSymbol,
+    SourceSymbol,
+    MarketSymbol,
+    Timestamp,
+    Year,
+    Month,
+    Day,
+    FileId,
+)
 from .splitter import DataSplitter
 
 ROW_GROUP_SIZE = 1000000
 
+# Directory of the lock files of a repository.
+LOCK_DIR = ".locks"
+
+# Name of the index of the files of a market, in the market directory.
+INDEX_NAME = "_index.txt"
+
+# Minimum number of index entries before the removed entries are compacted.
+INDEX_COMPACT_SIZE = 1000
+
+DAY_NS = 86400 * 10 ** 9
+
+# Name of the time column, whose row group statistics are used to skip row
+# groups outside a time range.
+TIME_COLUMN = "time"
+
+TIME_UNIT_NS = {"s": 10 ** 9, "ms": 10 ** 6, "us": 10 ** 3, "ns": 1}
+
 WRITER_OPTIONS = {
     "compression": "ZSTD",
     "version": "2.0",
     "data_page_version": "2.0",
 }
 
+# Page indexes are written by pyarrow >= 13, sorting columns by pyarrow >= 14.
+PYARROW_VERSION = tuple(int(part) for part in pa.__version__.split(".")[:2])
+
+
+def _leaf_columns(fields: Iterable[pa.Field], prefix: str = "") -> List[str]:
+    """
+    Get the Parquet column paths of fields, i.e. the paths of their leaves.
+
+    >>> _leaf_columns(pa.schema([("time", pa.int64()), ("price", pa.struct([("int", pa.uint64())]))]))
+    ['time', 'price.int']
+    """
+
+    columns = []
+    for f in fields:
+        if pa.types.is_struct(f.type):
+            columns += _leaf_columns(f.type, prefix + f.name + ".")
+        else:
+            columns.append(prefix + f.name)
+    return columns
+
+
+@dataclass(frozen=True)
+class WriteProfile:
+    """
+    Parquet layout of the files of a RecordsWriter. Columns without an
+    encoding are dictionary encoded. Per-column options only apply to the
+    columns of the records that have them.
+    """
+
+    compression: str = "ZSTD"
+    compression_level: Optional[int] = None
+    row_group_size: int = ROW_GROUP_SIZE
+    data_page_size: Optional[int] = None
+    column_encoding: Mapping[str, str] = field(default_factory=dict)
+    statistics: Optional[Tuple[str, ...]] = None  # None: all columns
+    sorting_columns: Tuple[str, ...] = ()
+    page_index: bool = False
+
+    def writer_options(self, schema: pa.Schema) -> Dict[str, Any]:
+        columns = _leaf_columns(schema)
+        encodings = {c: e for c, e in self.column_encoding.items() if c in columns}
+
+        options: Dict[str, Any] = {
+            **WRITER_OPTIONS,
+            "compression": self.compression,
+            "use_dictionary": [c for c in columns if c not in encodings],
+            "column_encoding": encodings or None,
+            "write_statistics": True,
+        }
+        if self.statistics is not None:
+            options["write_statistics"] = [c for c in self.statistics if c in columns]
+        if self.compression_level is not None:
+            options["compression_level"] = self.compression_level
+        if self.data_page_size is not None:
+            options["data_page_size"] = self.data_page_size
+        if self.page_index and PYARROW_VERSION >= (13, 0):
+            options["write_page_index"] = True
+        if self.sorting_columns and PYARROW_VERSION >= (14, 0):
+            options["sorting_columns"] = [
+                pq.SortingColumn(columns.index(c))
+                for c in self.sorting_columns
+                if c in columns
+            ]
+        return options
+
+
+# Encodings of the columns of trades records that are sorted (time, numeric
+# ids) or change little between records (prices).
+_DELTA_ENCODING = {
+    "time": "DELTA_BINARY_PACKED",
+    "price.int": "DELTA_BINARY_PACKED",
+    "external_id.numeric": "DELTA_BINARY_PACKED",
+}
+
+# Named write profiles of RecordsWriter:
+# - "archive": smallest files, for data that is rarely read;
+# - "hot": fast decoding and fine-grained skipping, for data read often.
+WRITE_PROFILES = {
+    "default": WriteProfile(),
+    "archive": WriteProfile(
+        compression="ZSTD",
+        compression_level=9,
+        data_page_size=1024 * 1024,
+        column_encoding=_DELTA_ENCODING,
+        statistics=("time",),
+        sorting_columns=("time",),
+    ),
+    "hot": WriteProfile(
+        compression="LZ4",
+        row_group_size=128 * 1024,
+        data_page_size=64 * 1024,
+        column_encoding={"time": "DELTA_BINARY_PACKED"},
+        sorting_columns=("time",),
+        page_index=True,
+    ),
+}
+
 
 class RecordsWriter:
-    def __init__(self, path: Path, *, row_group_size=ROW_GROUP_SIZE):
+    def __init__(
+        self,
+        path: Path,
+        *,
+        row_group_size: Optional[int] = None,
+        profile: str = "default",
+        on_close: Optional[Callable[[], None]] = None,
+    ):
         self._tmp_path = path.with_name(path.name + f".tmp_{token_hex(5)}")
         self._path = path
-        self._row_group_size = row_group_size
+        self._profile = WRITE_PROFILES[profile]
+        self._row_group_size = row_group_size or self._profile.row_group_size
+        self._on_close = on_close
         self._splitter = None
         self._writer = None
 
@@ -33,7 +184,7 @@ class RecordsWriter:
             self._writer = pq.ParquetWriter(
                 self._tmp_path,
                 schema=records.schema,
-                **WRITER_OPTIONS,
+                **self._profile.writer_options(records.schema),
             )
 
         self._splitter.add(records)
@@ -48,6 +199,8 @@ class RecordsWriter:
             self._writer.close()
             self._writer = None
             self._tmp_path.rename(self._path)
+            if self._on_close:
+                self._on_close()
 
         return self
 
@@ -74,30 +227,406 @@ class RecordsWriter:
         self._writer = None
 
 
+def _period(time: Union[Year, Month, Day, Timestamp]) -> Tuple[int, int]:
+    """
+    Get the period [start, end) in ns of the records of a file time. Files of
+    a timestamp hold records until the end of its day.
+
+    >>> _period(Month(2020, 12)) == (
+    ...     pandas.Timestamp("2020-12-01", tz="UTC").value,
+    ...     pandas.Timestamp("2021-01-01", tz="UTC").value,
+    ... )
+    True
+    """
+
+    if isinstance(time, Timestamp):
+        return time.timestamp.value, time.timestamp.normalize().value + DAY_NS
+
+    start = pandas.Timestamp(
+        year=time.year,
+        month=getattr(time, "month", 1),
+        day=getattr(time, "day", 1),
+        tz="UTC",
+    )
+    if isinstance(time, Year):
+        end = start + pandas.DateOffset(years=1)
+    elif isinstance(time, Month):
+        end = start + pandas.DateOffset(months=1)
+    else:
+        end = start + pandas.DateOffset(days=1)
+    return start.value, end.value
+
+
 class RecordsRepository:
-    def __init__(self, path: Path):
+    """
+    Repository of records files, one directory per subject, source, exchange,
+    instrument and year.
+
+    Files are written with the named write profile `profile` (see
+    `WRITE_PROFILES`).
+
+    With `index=True`, the files of each market are listed in an index in
+    the market directory, so `find()` reads the index instead of listing the
+    year directories. The index of a market is built on the first `find()`
+    of the market, and then kept up to date by the writers and `remove()`
+    of all repositories of the directory, with or without `index=True`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        memory_map: bool = False,
+        index: bool = False,
+        profile: str = "default",
+    ):
         self._path = path
+        self._memory_map = memory_map
+        self._index = index
+        self._profile = profile
 
-    def get(self, file: FileId) -> pa.Table:
-        return pq.read_table(self._fileid_to_path(file))
+    def get(
+        self,
+        file: FileId,
+        *,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> pa.Table:
+        """
+        Read the records of a file, or only some columns and the records in
+        the time range [start, end). Row groups outside the range are not
+        read, according to their time statistics.
+        """
 
-    def find(self, subject: Optional[SubjectSymbol] = None) -> Iterator[FileId]:
-        if subject:
-            glob_pattern = f"{subject}/*/*/*/*/*.{subject}.parquet"
-        else:
-            glob_pattern = "*/*/*/*/*/*.parquet"
+        if columns is None and start is None and end is None:
+            return pq.read_table(
+                self._fileid_to_path(file), memory_map=self._memory_map
+            )
+
+        parquet_file = pq.ParquetFile(
+            self._fileid_to_path(file),
+            memory_map=self._memory_map,
+        )
+        tables = list(self._read_row_groups(parquet_file, columns, start, end))
+        if not tables:
+            schema = parquet_file.schema_arrow
+            if columns is not None:
+                schema = pa.schema([schema.field(name) for name in columns])
+            return schema.empty_table()
+        return pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+
+    def get_row_groups(self, file: FileId) -> Iterator[pa.Table]:
+        parquet_file = pq.ParquetFile(
+            self._fileid_to_path(file),
+            memory_map=self._memory_map,
+        )
+        for index in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(index)
+
+    def scan(
+        self,
+        files: Iterable[FileId],
+        *,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Read the record batches of files (see `get()`), skipping the files
+        outside the time range. Files are streamed one row group at a time:
+        the next row group, of the same or the next file, is read on a
+        background thread while the batches of the current one are consumed.
+        """
+
+        start_ns = start.timestamp.value if start else None
+        end_ns = end.timestamp.value if end else None
+
+        def overlaps(file: FileId) -> bool:
+            file_start, file_end = _period(file.time)
+            if start_ns is not None and file_end <= start_ns:
+                return False
+            return end_ns is None or file_start < end_ns
+
+        def read(file: FileId) -> Iterator[pa.Table]:
+            parquet_file = pq.ParquetFile(
+                self._fileid_to_path(file),
+                memory_map=self._memory_map,
+            )
+            yield from self._read_row_groups(parquet_file, columns, start, end)
+
+        row_groups = (
+            records for file in files if overlaps(file) for records in read(file)
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(next, row_groups, None)
+                try:
+                    while True:
+                        records = future.result()
+                        if records is None:
+                            return
+                        future = executor.submit(next, row_groups, None)
+                        yield from records.to_batches()
+                finally:
+                    future.cancel()
+        finally:
+            row_groups.close()
+
+    def remove(self, file: FileId):
+        self._fileid_to_path(file).unlink(missing_ok=True)
+        self._update_index(file, "-")
+
+    @contextmanager
+    def lock(self, name: str) -> Iterator[bool]:
+        """
+        Lock a name for all processes using the repository, e.g. a market
+        being indexed. Yields False, without waiting, if it is locked already.
+        """
+
+        with open(self._lock_path(name), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def find(
+        self,
+        subject: Optional[SubjectSymbol] = None,
+        *,
+        source: Optional[SourceSymbol] = None,
+        market: Optional[MarketSymbol] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> Iterator[FileId]:
+        """
+        Find the files, ordered by file id, of a subject, source and market
+        with records in the time range [start, end). Only the directories
+        matching the filters are walked.
+        """
+
+        start_ns = start.timestamp.value if start else None
+        end_ns = end.timestamp.value if end else None
 
         last_file = None
-        for path in sorted(self._path.glob(glob_pattern)):
-            file = self._path_to_fileid(path)
-            if file:
+        for market_dir in self._market_dirs(subject, source, market):
+            if self._index:
+                files = self._read_index(market_dir)
+            else:
+                files = self._list_files(market_dir, start, end)
+
+            for file in files:
+                if start_ns is not None or end_ns is not None:
+                    file_start, file_end = _period(file.time)
+                    if start_ns is not None and file_end <= start_ns:
+                        continue
+                    if end_ns is not None and file_start >= end_ns:
+                        continue
                 if last_file:
                     assert file > last_file, "expect files to be ordered"  # type: ignore
                 yield file
                 last_file = file
 
     def writer(self, file: FileId) -> RecordsWriter:
-        return RecordsWriter(self._fileid_to_path(file))
+        return RecordsWriter(
+            self._fileid_to_path(file),
+            profile=self._profile,
+            on_close=partial(self._update_index, file, "+"),
+        )
+
+    def _read_row_groups(
+        self,
+        parquet_file: pq.ParquetFile,
+        columns: Optional[List[str]],
+        start: Optional[Timestamp],
+        end: Optional[Timestamp],
+    ) -> Iterator[pa.Table]:
+        if start is None and end is None:
+            for index in range(parquet_file.num_row_groups):
+                yield parquet_file.read_row_group(index, columns=columns)
+            return
+
+        field = parquet_file.schema_arrow.field(TIME_COLUMN)
+        unit_ns = TIME_UNIT_NS[field.type.unit]
+        start_ns = start.timestamp.value if start else None
+        end_ns = end.timestamp.value if end else None
+        read_columns = columns
+        if columns is not None and TIME_COLUMN not in columns:
+            read_columns = columns + [TIME_COLUMN]
+
+        # Parquet columns are the leaves of the schema, e.g. one per field of
+        # the external id struct.
+        metadata = parquet_file.metadata
+        time_index = None
+        if metadata.num_row_groups > 0:
+            row_group = metadata.row_group(0)
+            paths = [
+                row_group.column(i).path_in_schema for i in range(row_group.num_columns)
+            ]
+            time_index = paths.index(TIME_COLUMN)
+        for index in range(metadata.num_row_groups):
+            statistics = metadata.row_group(index).column(time_index).statistics
+            if statistics is not None and statistics.has_min_max:
+                if start_ns is not None and statistics.max_raw * unit_ns < start_ns:
+                    continue
+                if end_ns is not None and statistics.min_raw * unit_ns >= end_ns:
+                    continue
+
+            records = parquet_file.read_row_group(index, columns=read_columns)
+            time = records[TIME_COLUMN].cast(pa.int64())
+            mask = None
+            if start_ns is not None:
+                mask = pc.greater_equal(time, -(-start_ns // unit_ns))
+            if end_ns is not None:
+                before_end = pc.less(time, -(-end_ns // unit_ns))
+                mask = before_end if mask is None else pc.and_(mask, before_end)
+            records = records.filter(mask)
+            if read_columns is not columns:
+                records = records.drop([TIME_COLUMN])
+            if records.num_rows > 0:
+                yield records
+
+    def _lock_path(self, name: str) -> Path:
+        lock_path = self._path / LOCK_DIR / (re.sub(r"[^\w\-]", "_", name) + ".lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        return lock_path
+
+    @contextmanager
+    def _index_lock(self, market_dir: Path) -> Iterator[None]:
+        name = "index:" + market_dir.relative_to(self._path).as_posix()
+        with open(self._lock_path(name), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update_index(self, file: FileId, op: str):
+        """
+        Add (+) or remove (-) a file in the index of its market, if the
+        market is indexed already. This is done by every repository, indexed
+        or not, so the index never misses the changes of other repositories
+        of the same directory.
+
+        The index is checked under its lock, so it is either built before
+        and gets the update appended here, or built after and lists the file
+        as it is now.
+        """
+
+        market_dir = self._fileid_to_path(file).parent.parent
+        index_path = market_dir / INDEX_NAME
+        with self._index_lock(market_dir):
+            if index_path.exists():
+                with open(index_path, "a", encoding="utf-8") as index_file:
+                    index_file.write(f"{op}{file.as_str()}\n")
+
+    def _read_index(self, market_dir: Path) -> List[FileId]:
+        """
+        Read the index of a market, building it from the listing of the
+        market directory if it does not exist yet. The index is rewritten
+        without its removed entries once those are the most.
+        """
+
+        index_path = market_dir / INDEX_NAME
+        with self._index_lock(market_dir):
+            if not index_path.exists():
+                files = list(self._list_files(market_dir))
+                self._write_index(index_path, files)
+                return files
+
+            entries: Set[str] = set()
+            num_lines = 0
+            with open(index_path, encoding="utf-8") as index_file:
+                for line in index_file:
+                    num_lines += 1
+                    if line.startswith("+"):
+                        entries.add(line[1:].rstrip("\n"))
+                    elif line.startswith("-"):
+                        entries.discard(line[1:].rstrip("\n"))
+
+            files = sorted(map(FileId.from_str, entries))
+            if num_lines > max(INDEX_COMPACT_SIZE, 2 * len(files)):
+                self._write_index(index_path, files)
+            return files
+
+    def _write_index(self, index_path: Path, files: List[FileId]):
+        tmp_path = index_path.with_name(index_path.name + f".tmp_{token_hex(5)}")
+        with open(tmp_path, "w", encoding="utf-8") as index_file:
+            index_file.writelines(f"+{file.as_str()}\n" for file in files)
+        tmp_path.rename(index_path)
+
+    def _market_dirs(
+        self,
+        subject: Optional[SubjectSymbol],
+        source: Optional[SourceSymbol],
+        market: Optional[MarketSymbol],
+    ) -> Iterator[Path]:
+        """
+        Walk the subject/source/exchange/instrument directories matching the
+        filters, in the order of the file ids in them.
+        """
+
+        levels = [
+            str(subject) if subject else None,
+            str(source) if source else None,
+            str(market.exchange) if market else None,
+            str(market.instrument).replace("/", "_") if market else None,
+        ]
+
+        dirs = [self._path]
+        for level, name in enumerate(levels):
+            subdirs = []
+            for dir in dirs:
+                if name is not None:
+                    if (dir / name).is_dir():
+                        subdirs.append(dir / name)
+                    continue
+
+                # Ordered like the file id strings, in which the directory
+                # names are followed by ":" (and "_" is "/" in instruments).
+                children = [
+                    child
+                    for child in dir.iterdir()
+                    if child.is_dir() and not child.name.startswith(".")
+                ]
+                if level == len(levels) - 1:
+                    children.sort(key=lambda d: d.name.replace("_", "/") + ":")
+                else:
+                    children.sort(key=lambda d: d.name + ":")
+                subdirs.extend(children)
+            dirs = subdirs
+        return iter(dirs)
+
+    def _list_files(
+        self,
+        market_dir: Path,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> Iterator[FileId]:
+        """
+        List the files of a market, skipping the years outside [start, end).
+        """
+
+        for year_dir in sorted(market_dir.iterdir()):
+            if not (year_dir.is_dir() and year_dir.name.isdigit()):
+                continue
+            if start and int(year_dir.name) < start.year:
+                continue
+            if end and int(year_dir.name) > (end.timestamp - pandas.Timedelta(1)).year:
+                continue
+
+            files = []
+            for path in year_dir.glob("*.parquet"):
+                file = self._path_to_fileid(path)
+                if file:
+                    files.append(file)
+            yield from sorted(files)
 
     def _fileid_to_path(self, file: FileId):
         return self._path.joinpath(
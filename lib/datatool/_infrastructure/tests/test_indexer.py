@@ -0,0 +1,126 @@
+import pyarrow as pa
+import pandas
+from ...model.types import FileId, MarketSymbol, SourceSymbol, SubjectSymbol
+from ...write.indexer import index_shard_sync
+from ..records import RecordsRepository
+from .test_records import TempDirectory
+
+_SHARD = (
+    SubjectSymbol("trades"),
+    SourceSymbol("src"),
+    MarketSymbol.from_symbol("ex:btc/eur"),
+)
+_EXTERNAL_ID = pa.struct([pa.field("numeric", pa.uint64())])
+
+
+def _fileid(time):
+    return FileId.from_str(f"trades:src:ex:btc/eur:{time}")
+
+
+def _records(times, ids, values):
+    return pa.table(
+        {
+            "external_id": pa.array([{"numeric": i} for i in ids], type=_EXTERNAL_ID),
+            "time": pa.array(
+                [pandas.Timestamp(t, tz="UTC").value for t in times],
+                type=pa.timestamp("ns", tz="UTC"),
+            ),
+            "value": values,
+        }
+    )
+
+
+def _repositories(tmp):
+    return RecordsRepository(tmp / "data"), RecordsRepository(tmp / "wal")
+
+
+def test_index_shard_sync_rollup():
+    with TempDirectory() as tmp:
+        data, wal = _repositories(tmp)
+        wal_records = {
+            "2020-06-01T10:00:00Z": _records(["2020-06-01T10:00"], [1], ["a"]),
+            "2021-01-15T10:00:00Z": _records(["2021-01-15T10:00"], [2], ["b"]),
+            "2021-03-01T10:00:00Z": _records(["2021-03-01T10:00"], [3], ["c"]),
+            "2021-03-05T10:00:00Z": _records(["2021-03-05T10:00"], [4], ["d"]),
+            "2021-03-05T12:00:00Z": _records(["2021-03-05T12:00"], [5], ["e"]),
+        }
+        for time, records in wal_records.items():
+            wal.writer(_fileid(time)).write(records).close()
+
+        stats = index_shard_sync(data, wal, _SHARD)
+
+        assert [] == list(wal.find()), "WAL files removed"
+        assert [
+            _fileid("2020"),
+            _fileid("2021-01"),
+            _fileid("2021-03-01"),
+            _fileid("2021-03-05"),
+        ] == list(data.find()), "year, month and day files"
+        assert ["d", "e"] == data.get(_fileid("2021-03-05"))["value"].to_pylist()
+        assert 5 == stats.num_files_read, "files read"
+        assert 4 == stats.num_files_written, "files written"
+        assert 5 == stats.num_records, "records"
+
+
+def test_index_shard_sync_deduplicate():
+    with TempDirectory() as tmp:
+        data, wal = _repositories(tmp)
+        times = ["2021-03-05T10:00", "2021-03-05T11:00", "2021-03-05T12:00"]
+        data.writer(_fileid("2021-03-05")).write(
+            _records(times[0:2], [1, 2], ["data", "data"])
+        ).close()
+        wal.writer(_fileid("2021-03-05T11:00:00Z")).write(
+            _records(times[1:3], [2, 3], ["wal", "wal"])
+        ).close()
+
+        index_shard_sync(data, wal, _SHARD)
+
+        records = data.get(_fileid("2021-03-05"))
+        assert [1, 2, 3] == [i["numeric"] for i in records["external_id"].to_pylist()]
+        assert ["data", "data", "wal"] == records["value"].to_pylist(), "data wins"
+
+
+def test_index_shard_sync_again():
+    with TempDirectory() as tmp:
+        data, wal = _repositories(tmp)
+        records = _records(["2021-03-05T10:00", "2021-03-05T11:00"], [1, 2], [1, 2])
+        wal.writer(_fileid("2021-03-05T10:00:00Z")).write(records).close()
+        index_shard_sync(data, wal, _SHARD)
+
+        # As if the indexer stopped before removing the merged WAL file.
+        wal.writer(_fileid("2021-03-05T10:00:00Z")).write(records).close()
+        stats = index_shard_sync(data, wal, _SHARD)
+
+        assert [] == list(wal.find()), "WAL files removed"
+        assert [_fileid("2021-03-05")] == list(data.find()), "data files"
+        assert records == data.get(_fileid("2021-03-05")), "no duplicates"
+        assert 2 == stats.num_files_read, "files read"
+
+        stats = index_shard_sync(data, wal, _SHARD)
+        assert 0 == stats.num_files_read, "nothing left to index"
+        assert not stats.locked, "not locked"
+
+
+def test_index_shard_sync_output_is_input():
+    with TempDirectory() as tmp:
+        data, wal = _repositories(tmp)
+        data.writer(_fileid("2019")).write(_records(["2019-05-01"], [1], [1])).close()
+        data.writer(_fileid("2020")).write(_records(["2020-05-01"], [2], [2])).close()
+        wal.writer(_fileid("2020-06-01T00:00:00Z")).write(
+            _records(["2020-06-01"], [3], [3])
+        ).close()
+        wal.writer(_fileid("2021-03-05T00:00:00Z")).write(
+            _records(["2021-03-05"], [4], [4])
+        ).close()
+
+        stats = index_shard_sync(data, wal, _SHARD)
+
+        assert [
+            _fileid("2019"),
+            _fileid("2020"),
+            _fileid("2021-03-05"),
+        ] == list(data.find()), "data files"
+        assert [2, 3] == data.get(_fileid("2020"))["value"].to_pylist()
+        assert [1] == data.get(_fileid("2019"))["value"].to_pylist(), "untouched"
+        assert 3 == stats.num_files_read, "files of merged buckets only"
+        assert 2 == stats.num_files_written, "files written"
@@ -9,8 +9,20 @@ from calendar import monthrange
 from secrets import token_urlsafe
 from random import Random
 from pathlib import Path
-from ...model.types import FileId
-from ..records import ROW_GROUP_SIZE, RecordsWriter, RecordsRepository
+from ...model.types import (
+    FileId,
+    MarketSymbol,
+    SourceSymbol,
+    SubjectSymbol,
+    Timestamp,
+)
+from ..records import (
+    INDEX_NAME,
+    ROW_GROUP_SIZE,
+    WRITE_PROFILES,
+    RecordsWriter,
+    RecordsRepository,
+)
 
 
 # Mock data series
@@ -185,6 +197,21 @@ def test_RecordsWriter_write_big():
         assert count == pq.read_metadata(filename).num_row_groups, "row groups"
 
 
+def test_RecordsWriter_profiles():
+    with TempDirectory() as tmp:
+        records = _timed_records(_SIZE_1)
+
+        for profile in WRITE_PROFILES:
+            filename = tmp / f"{profile}.parquet"
+            RecordsWriter(filename, profile=profile).write(records).close()
+            assert records == pq.read_table(filename), f"{profile} records content"
+
+        metadata = pq.read_metadata(tmp / "archive.parquet").row_group(0)
+        assert "DELTA_BINARY_PACKED" in metadata.column(0).encodings, "time encoding"
+        assert metadata.column(0).is_stats_set, "time statistics"
+        assert not metadata.column(1).is_stats_set, "no int statistics"
+
+
 def test_RecordsWriter_pickle():
     with TempDirectory() as tmp:
         records = _RECORDS_SMALL
@@ -220,6 +247,150 @@ def test_RecordsRepository_get():
         assert records == repository.get(file), "records content"
 
 
+def test_RecordsRepository_get_memory_map():
+    with TempDirectory() as tmp:
+        (file,) = _FILEID.random(1)
+        records = _RECORDS_BIG
+
+        RecordsRepository(tmp).writer(file).write(records).close()
+
+        repository = RecordsRepository(tmp, memory_map=True)
+        assert records == repository.get(file), "records content"
+
+
+def _timed_records(n):
+    return pa.table(
+        {
+            "time": pa.array(range(n), type=pa.timestamp("ns", tz="UTC")),
+            "int": pa.chunked_array([_ARRAY_INT] * math.ceil(n / _SIZE_1))[0:n],
+        }
+    )
+
+
+def test_RecordsRepository_get_columns_and_time_range(monkeypatch):
+    with TempDirectory() as tmp:
+        (file,) = _FILEID.random(1)
+        records = _timed_records(ROW_GROUP_SIZE + 1000)
+
+        repository = RecordsRepository(tmp)
+        repository.writer(file).write(records).close()
+
+        assert records.select(["int"]) == repository.get(
+            file, columns=["int"]
+        ), "columns"
+
+        read_row_group = pq.ParquetFile.read_row_group
+        row_groups_read = []
+
+        def counting_read_row_group(self, index, *args, **kwargs):
+            row_groups_read.append(index)
+            return read_row_group(self, index, *args, **kwargs)
+
+        monkeypatch.setattr(pq.ParquetFile, "read_row_group", counting_read_row_group)
+
+        start = Timestamp(pandas.Timestamp(ROW_GROUP_SIZE + 10, tz="UTC"))
+        end = Timestamp(pandas.Timestamp(ROW_GROUP_SIZE + 20, tz="UTC"))
+        assert records.select(["int"])[ROW_GROUP_SIZE + 10 : ROW_GROUP_SIZE + 20] == (
+            repository.get(file, columns=["int"], start=start, end=end)
+        ), "records of the time range"
+        assert [1] == row_groups_read, "row groups outside the range skipped"
+
+        assert records[0 : ROW_GROUP_SIZE + 10] == repository.get(
+            file, end=start
+        ), "records before a time"
+        assert 0 == len(
+            repository.get(file, start=Timestamp(pandas.Timestamp(10 ** 12, tz="UTC")))
+        ), "no records"
+
+
+def test_RecordsRepository_scan():
+    with TempDirectory() as tmp:
+        files = [
+            FileId.from_str(f"trades:src:ex:btc/eur:{time}")
+            for time in ["1970", "1970-01-01", "2020-11-02"]
+        ]
+        records = _timed_records(_SIZE_1)
+
+        repository = RecordsRepository(tmp)
+        for file in files:
+            repository.writer(file).write(records).close()
+
+        batches = list(repository.scan(files, columns=["int"]))
+        assert pa.concat_tables([records.select(["int"])] * len(files)) == (
+            pa.Table.from_batches(batches)
+        ), "records of all files"
+
+        repository.remove(files[2])
+        start = Timestamp(pandas.Timestamp(100, tz="UTC"))
+        end = Timestamp(pandas.Timestamp(200, tz="UTC"))
+        batches = list(repository.scan(files, start=start, end=end))
+        assert pa.concat_tables([records[100:200]] * 2) == (
+            pa.Table.from_batches(batches)
+        ), "records of the files of the time range"
+
+
+def test_RecordsRepository_scan_row_groups():
+    with TempDirectory() as tmp:
+        files = _FILEID.random(2)
+        records = _RECORDS_BIG
+
+        repository = RecordsRepository(tmp)
+        for file in files:
+            repository.writer(file).write(records).close()
+
+        batches = list(repository.scan(files))
+        num_row_groups = math.ceil(len(records) / ROW_GROUP_SIZE)
+        assert len(files) * num_row_groups <= len(batches), "row groups streamed"
+        assert max(len(batch) for batch in batches) <= ROW_GROUP_SIZE, "batch size"
+        assert pa.concat_tables([records] * len(files)) == (
+            pa.Table.from_batches(batches)
+        ), "records of all files"
+
+
+def test_RecordsRepository_get_row_groups():
+    with TempDirectory() as tmp:
+        (file,) = _FILEID.random(1)
+        records = _RECORDS_BIG
+
+        repository = RecordsRepository(tmp)
+        repository.writer(file).write(records).close()
+
+        row_groups = list(repository.get_row_groups(file))
+        assert math.ceil(len(records) / ROW_GROUP_SIZE) == len(row_groups), "row groups"
+        assert ROW_GROUP_SIZE == len(row_groups[0]), "row group size"
+        assert records == pa.concat_tables(row_groups), "records content"
+
+
+def test_RecordsRepository_remove():
+    with TempDirectory() as tmp:
+        file1, file2 = _FILEID.random(2)
+
+        repository = RecordsRepository(tmp)
+        repository.writer(file1).write(_RECORDS_SMALL).close()
+        repository.writer(file2).write(_RECORDS_SMALL).close()
+        repository.remove(file1)
+        repository.remove(file1)
+
+        assert [file2] == list(repository.find()), "list of files"
+
+
+def test_RecordsRepository_lock():
+    with TempDirectory() as tmp:
+        repository = RecordsRepository(tmp)
+        other_repository = RecordsRepository(tmp)
+
+        with repository.lock("trades:src:ex:btc/eur") as locked:
+            assert locked, "lock acquired"
+            with other_repository.lock("trades:src:ex:btc/eur") as locked_again:
+                assert not locked_again, "lock held"
+            with other_repository.lock("trades:src:ex:eth/eur") as locked_other:
+                assert locked_other, "other lock acquired"
+
+        with other_repository.lock("trades:src:ex:btc/eur") as locked:
+            assert locked, "lock released"
+        assert [] == list(repository.find()), "no files"
+
+
 def test_RecordsRepository_find():
     with TempDirectory() as tmp:
         files = sorted(_FILEID.random(47))
@@ -233,6 +404,105 @@ def test_RecordsRepository_find():
         assert files == list(repository.find()), "list of files"
 
 
+def test_RecordsRepository_find_order():
+    with TempDirectory() as tmp:
+        # Directory names sort differently than file ids ("/" < "-" < ":").
+        files = sorted(
+            FileId.from_str(f"trades:{source}:ex:btc/{quote}:2020-11-02")
+            for source in ["src", "src-a", "src1"]
+            for quote in ["eur", "eur-a", "eur1", "eur/ext"]
+        )
+
+        repository = RecordsRepository(tmp)
+        for file in files:
+            repository.writer(file).write(_RECORDS_SMALL).close()
+
+        assert files == list(repository.find()), "list of files"
+
+
+def test_RecordsRepository_find_filters():
+    with TempDirectory() as tmp:
+        files = sorted(
+            FileId.from_str(f"trades:{source}:ex:{instrument}:{time}")
+            for source in ["src-a", "src-b"]
+            for instrument in ["btc/eur", "eth/eur"]
+            for time in [
+                "2019",
+                "2020-10",
+                "2020-11-01",
+                "2020-11-02",
+                "2020-11-02T23:00:00.000000000Z",
+            ]
+        )
+
+        repository = RecordsRepository(tmp)
+        for file in files:
+            repository.writer(file).write(_RECORDS_SMALL).close()
+
+        source = SourceSymbol("src-b")
+        market = MarketSymbol.from_symbol("ex:eth/eur")
+        market_files = [f for f in files if f.source == source and f.market == market]
+        assert market_files == list(
+            repository.find(source=source, market=market)
+        ), "files of a market"
+        assert [] == list(repository.find(SubjectSymbol("ohlc:1m"))), "no files"
+
+        assert [
+            "2020-10",
+            "2020-11-01",
+            "2020-11-02",
+            "2020-11-02T23:00:00.000000000Z",
+        ] == [
+            str(file.time)
+            for file in repository.find(
+                source=source,
+                market=market,
+                start=Timestamp.from_iso("2020-10-31T12:00"),
+                end=Timestamp.from_iso("2020-11-03"),
+            )
+        ], "files of a time range"
+        assert ["2019", "2020-10", "2020-11-01"] == [
+            str(file.time)
+            for file in repository.find(
+                source=source,
+                market=market,
+                end=Timestamp.from_iso("2020-11-02"),
+            )
+        ], "files before a time"
+
+
+def test_RecordsRepository_index():
+    with TempDirectory() as tmp:
+        file1, file2, file3 = _FILEID.random(n=3, n_same_root=3)
+
+        RecordsRepository(tmp).writer(file1).write(_RECORDS_SMALL).close()
+
+        repository = RecordsRepository(tmp, index=True)
+        assert [file1] == list(repository.find()), "index built from files"
+
+        repository.writer(file2).write(_RECORDS_SMALL).close()
+        repository.writer(file3).write(_RECORDS_SMALL).close()
+        repository.remove(file1)
+        assert sorted([file2, file3]) == list(repository.find()), "index updated"
+
+        index_paths = list(tmp.rglob(INDEX_NAME))
+        assert 1 == len(index_paths), "index of the market"
+        (tmp / "other").mkdir()
+        assert sorted([file2, file3]) == list(repository.find()), "index read"
+        assert list(RecordsRepository(tmp).find()) == list(
+            repository.find()
+        ), "same files as listed"
+
+        (file4,) = _FILEID.random(1)
+        file4 = FileId(file2.subject, file2.source, file2.market, file4.time)
+        other_repository = RecordsRepository(tmp)
+        other_repository.writer(file4).write(_RECORDS_SMALL).close()
+        other_repository.remove(file2)
+        assert sorted([file3, file4]) == list(
+            repository.find()
+        ), "index updated by a repository without index"
+
+
 def test_RecordsRepository_writer():
     with TempDirectory() as tmp:
         file1, file2, file3 = _FILEID.random(n=3, n_same_root=2)
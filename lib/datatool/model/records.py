@@ -1,6 +1,14 @@
-from typing import Protocol, Optional, Tuple, Iterator, Iterable
-from pyarrow import Table
-from .types import SubjectSymbol, FileId
+from typing import (
+    ContextManager,
+    Protocol,
+    Optional,
+    Tuple,
+    Iterator,
+    Iterable,
+    List,
+)
+from pyarrow import RecordBatch, Table
+from .types import SubjectSymbol, SourceSymbol, MarketSymbol, Timestamp, FileId
 
 
 class RecordsWriter(Protocol):
@@ -12,10 +20,44 @@ class RecordsWriter(Protocol):
 
 
 class RecordsRepository(Protocol):
-    def get(self, file: FileId) -> Table:
+    def get(
+        self,
+        file: FileId,
+        *,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> Table:
         ...
 
-    def find(self, subject: Optional[SubjectSymbol] = None) -> Iterator[FileId]:
+    def scan(
+        self,
+        files: Iterable[FileId],
+        *,
+        columns: Optional[List[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> Iterator[RecordBatch]:
+        ...
+
+    def get_row_groups(self, file: FileId) -> Iterator[Table]:
+        ...
+
+    def remove(self, file: FileId):
+        ...
+
+    def lock(self, name: str) -> ContextManager[bool]:
+        ...
+
+    def find(
+        self,
+        subject: Optional[SubjectSymbol] = None,
+        *,
+        source: Optional[SourceSymbol] = None,
+        market: Optional[MarketSymbol] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+    ) -> Iterator[FileId]:
         ...
 
     def writer(self, file: FileId) -> RecordsWriter:
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from functools import cached_property, lru_cache
 from typing import Protocol, Optional, Union
 import pandas, re, datetime
 
@@ -17,13 +18,23 @@ YEAR_REGEX = re.compile(r"\A(\d{4})\Z")
 MONTH_REGEX = re.compile(r"\A(\d{4})-(\d{2})\Z")
 DAY_REGEX = re.compile(r"\A(\d{4})-(\d{2})-(\d{2})\Z")
 
+# Number of parsed symbols and file ids to keep, so that listing or merging
+# the same files again does not parse (and validate) them again.
+SYMBOL_CACHE_SIZE = 4096
+FILEID_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=SYMBOL_CACHE_SIZE)
+def _is_symbol(symbol: str) -> bool:
+    return SYMBOL_REGEX.match(symbol) is not None
+
 
 @dataclass(repr=False, order=True, frozen=True)
 class Symbol:
     symbol: str
 
     def __post_init__(self):
-        if not SYMBOL_REGEX.match(self.symbol):
+        if not _is_symbol(self.symbol):
             raise ValueError(f"invalid symbol: {repr(self.symbol)}")
 
     def __repr__(self) -> str:
@@ -256,6 +267,7 @@ class InstrumentSymbol:
     extension: Optional[Symbol] = None
 
     @staticmethod
+    @lru_cache(maxsize=SYMBOL_CACHE_SIZE)
     def from_symbol(symbol: str) -> "InstrumentSymbol":
         parts = symbol.lower().split("/")
         if len(parts) == 2:
@@ -292,6 +304,7 @@ class MarketSymbol:
     instrument: InstrumentSymbol
 
     @staticmethod
+    @lru_cache(maxsize=SYMBOL_CACHE_SIZE)
     def from_symbol(symbol: str) -> "MarketSymbol":
         parts = symbol.split(":")
         if len(parts) == 2:
@@ -321,7 +334,19 @@ class FileId:
     time: Union[Year, Month, Day, Timestamp]
 
     @staticmethod
+    @lru_cache(maxsize=FILEID_CACHE_SIZE)
     def from_str(s: str) -> "FileId":
+        """
+        Parse a file id string. File ids are immutable, so the same string
+        returns the same (cached) file id.
+
+        >>> fileid = FileId.from_str("trades:kraken-rest:kraken:btc/eur:2020-11-02")
+        >>> fileid is FileId.from_str("trades:kraken-rest:kraken:btc/eur:2020-11-02")
+        True
+        >>> fileid < FileId.from_str("trades:kraken-rest:kraken:btc/eur:2020-11-02T10:00:00Z")
+        True
+        """
+
         parts = s.lower().split(":", 4)
         if len(parts) != 5:
             raise ValueError(f"invalid fileid string: {repr(s)}")
@@ -332,10 +357,10 @@ class FileId:
             time = Year.from_iso(parts[4])
         elif time_size == 7:
             time = Month.from_iso(parts[4])
-        elif time_size == 8:
+        elif time_size == 10:
             time = Day.from_iso(parts[4])
         else:
-            time = Timestamp.from_iso(parts[4])
+            time = Timestamp.from_iso(parts[4].upper())
 
         return FileId(
             SubjectSymbol(parts[0]),
@@ -344,7 +369,13 @@ class FileId:
             time,
         )
 
-    def as_str(self) -> str:
+    @cached_property
+    def sort_key(self) -> str:
+        """
+        Key ordering file ids like their paths in a repository, i.e. the file
+        id string, built once per file id.
+        """
+
         parts = [
             self.subject.symbol,
             self.source.symbol,
@@ -353,17 +384,20 @@ class FileId:
         ]
         return ":".join(parts)
 
+    def as_str(self) -> str:
+        return self.sort_key
+
     def __gt__(self, other: "FileId") -> bool:
-        return self.as_str() > other.as_str()
+        return self.sort_key > other.sort_key
 
     def __lt__(self, other: "FileId") -> bool:
-        return self.as_str() < other.as_str()
+        return self.sort_key < other.sort_key
 
     def __ge__(self, other: "FileId") -> bool:
-        return self.as_str() >= other.as_str()
+        return self.sort_key >= other.sort_key
 
     def __le__(self, other: "FileId") -> bool:
-        return self.as_str() <= other.as_str()
+        return self.sort_key <= other.sort_key
 
     def __repr__(self) -> str:
         return "%s.from_symbol(%r)" % (self.__class__.__name__, self.as_str())
@@ -1,8 +1,25 @@
 import asyncio
+import os
+import time
 from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
 from ..model.records import RecordsRepository
+from ..model.types import (
+    Day,
+    FileId,
+    MarketSymbol,
+    Month,
+    SourceSymbol,
+    SubjectSymbol,
+    Timestamp,
+    Year,
+)
+from .merging import merge_records
 from .session import Session
 
+DEFAULT_WORKERS = os.cpu_count() or 1
+
 
 class DatasetIndexer:
     def __init__(
@@ -11,36 +28,218 @@ class DatasetIndexer:
         write_ahead_log: RecordsRepository,
         *,
         session: Session = Session(),
+        workers: int = DEFAULT_WORKERS,
     ):
         self._data = data
         self._write_ahead_log = write_ahead_log
         self._session = session
+        self._workers = workers
+
+    async def index(self) -> List["ShardStats"]:
+        async with self._session.resource(IndexAsyncPool, self._workers) as pool:
+            return await pool.index_async(self._data, self._write_ahead_log)
+
+
+def _first_day(time: Union[Year, Month, Day, Timestamp]) -> Day:
+    return Day(time.year, getattr(time, "month", 1), getattr(time, "day", 1))
+
+
+def _start_time(time: Union[Year, Month, Day, Timestamp]) -> int:
+    if isinstance(time, Timestamp):
+        return time.timestamp.value
+    return _first_day(time).as_timestamp().timestamp.value
+
+
+def _bucket(time: Union[Year, Month, Day, Timestamp], last_day: Day):
+    """
+    Get the period of the data file that records of a time are merged into:
+    the year for past years, the month for past months of the last year, and
+    the day otherwise, but never a shorter period than the time itself.
+
+    >>> [str(_bucket(t, Day(2021, 3, 5))) for t in [Day(2020, 12, 31), Day(2021, 2, 1), Day(2021, 3, 1)]]
+    ['2020', '2021-02', '2021-03-01']
+    >>> str(_bucket(Month(2021, 3), Day(2021, 3, 5)))
+    '2021-03'
+    """
+
+    if time.year < last_day.year or isinstance(time, Year):
+        return Year(time.year)
+    if time.month < last_day.month or isinstance(time, Month):  # type: ignore
+        return Month(time.year, time.month)  # type: ignore
+    return Day(time.year, time.month, time.day)  # type: ignore
+
+
+@dataclass(frozen=True)
+class ShardStats:
+    """
+    Throughput of indexing one shard, i.e. the files of one market.
+
+    >>> print(ShardStats("trades:kraken:kraken:btc/eur", 12, 3, 2000000, 4.0))
+    trades:kraken:kraken:btc/eur: 12 files => 3 files, 2000000 records in 4.00 s (500000 records/s)
+    >>> print(ShardStats("trades:kraken:kraken:btc/eur", locked=True))
+    trades:kraken:kraken:btc/eur: locked by another indexer
+    """
+
+    shard: str
+    num_files_read: int = 0
+    num_files_written: int = 0
+    num_records: int = 0
+    seconds: float = 0.0
+    locked: bool = False
+
+    @property
+    def records_per_second(self) -> float:
+        return self.num_records / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        if self.locked:
+            return f"{self.shard}: locked by another indexer"
+        return (
+            f"{self.shard}: {self.num_files_read} files => {self.num_files_written}"
+            f" files, {self.num_records} records in {self.seconds:.2f} s"
+            f" ({self.records_per_second:.0f} records/s)"
+        )
+
+
+Shard = Tuple[SubjectSymbol, SourceSymbol, MarketSymbol]
 
-    async def index(self):
-        async with self._session.resource(IndexAsyncPool) as pool:
-            await pool.index_async(self._data, self._write_ahead_log)
+
+def find_shards(write_ahead_log: RecordsRepository) -> List[Shard]:
+    """
+    Find the markets with WAL files.
+    """
+
+    shards: Dict[Shard, None] = {}
+    for file in write_ahead_log.find():
+        shards[(file.subject, file.source, file.market)] = None
+    return list(shards)
+
+
+def index_shard_sync(
+    data: RecordsRepository,
+    write_ahead_log: RecordsRepository,
+    shard: Shard,
+) -> ShardStats:
+    """
+    Merge the WAL files of a market into the data repository. The WAL files
+    and data files are rolled up into one data file per year, per month of
+    the last year and per day of the last month, relative to the last day of
+    the market. Each data file is written by a streaming, time-ordered merge
+    of its input files without duplicates (see `merging.merge_records`),
+    after which the merged WAL files and the data files of shorter periods
+    are removed.
+
+    Data files keep their records on top of WAL records of the same time and
+    external id. Should the indexer stop after writing a data file but before
+    removing its input files, they are merged again, and de-duplicated if
+    they have external ids.
+
+    The market is locked while it is indexed, and its files are listed once
+    locked, so another indexer that merged the market meanwhile is never
+    merged again from stale lists. If another indexer holds the lock, or no
+    WAL files are left, the market is skipped.
+    """
+
+    subject, source, market = shard
+    name = f"{subject}:{source}:{market}"
+    started = time.perf_counter()
+    num_files_read = 0
+    num_files_written = 0
+    num_records = 0
+
+    with data.lock(name) as locked:
+        if not locked:
+            return ShardStats(name, locked=True)
+
+        wal_files = list(write_ahead_log.find(subject, source=source, market=market))
+        if not wal_files:
+            return ShardStats(name)
+        data_files = list(data.find(subject, source=source, market=market))
+
+        files = [(file, data) for file in data_files] + [
+            (file, write_ahead_log) for file in wal_files
+        ]
+        last_day = max(_first_day(file.time) for file, _ in files)
+        buckets: Dict[Union[Year, Month, Day], List] = {}
+        for file, repository in files:
+            bucket = _bucket(file.time, last_day)
+            buckets.setdefault(bucket, []).append((file, repository))
+
+        for bucket, bucket_files in sorted(buckets.items(), key=lambda b: str(b[0])):
+            data_file = FileId(subject, source, market, bucket)
+            if [file for file, _ in bucket_files] == [data_file]:
+                continue
+
+            # Data files first, so their records are kept over duplicates.
+            bucket_files.sort(key=lambda f: (f[1] is write_ahead_log, f[0]))
+            writer = data.writer(data_file)
+            inputs = [repository.get_row_groups(f) for f, repository in bucket_files]
+            starts = [_start_time(file.time) for file, _ in bucket_files]
+            for records in merge_records(inputs, starts):
+                writer.write(records)
+                num_records += len(records)
+            writer.close()
+            num_files_read += len(bucket_files)
+            num_files_written += 1
+
+            for file, repository in bucket_files:
+                if not (file == data_file and repository is data):
+                    repository.remove(file)
+
+    return ShardStats(
+        name,
+        num_files_read=num_files_read,
+        num_files_written=num_files_written,
+        num_records=num_records,
+        seconds=time.perf_counter() - started,
+    )
 
 
 def index_sync(data: RecordsRepository, write_ahead_log: RecordsRepository):
-    # TODO: Implement merging algorithm
-    wal_files = list(write_ahead_log.find())
-    for file in data.find():
-        while len(wal_files) > 0 and file > wal_files[0]:
-            print("wal:", wal_files.pop(0))
-        print("data:", file)
+    """
+    Merge the write-ahead log into the data repository, one market after the
+    other (see `index_shard_sync`).
+    """
+
+    stats = []
+    for shard in find_shards(write_ahead_log):
+        stats.append(index_shard_sync(data, write_ahead_log, shard))
+        print(stats[-1])
+    return stats
 
 
 class IndexAsyncPool:
-    def __init__(self):
-        self._pool = ProcessPoolExecutor(max_workers=1)
+    """
+    Pool of indexer processes. Markets are indexed in parallel, each market
+    by one process at a time.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS):
+        self._pool = ProcessPoolExecutor(max_workers=max_workers)
 
     async def index_async(
         self,
         data: RecordsRepository,
         write_ahead_log: RecordsRepository,
-    ):
+    ) -> List[ShardStats]:
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(self._pool, index_sync, data, write_ahead_log)
+        shards = await loop.run_in_executor(self._pool, find_shards, write_ahead_log)
+
+        tasks = [
+            loop.run_in_executor(
+                self._pool,
+                index_shard_sync,
+                data,
+                write_ahead_log,
+                shard,
+            )
+            for shard in shards
+        ]
+        stats = []
+        for task in asyncio.as_completed(tasks):
+            stats.append(await task)
+            print(stats[-1])
+        return stats
 
     async def close(self):
         self._pool.shutdown()
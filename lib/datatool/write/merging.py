@@ -0,0 +1,162 @@
+import pyarrow as pa
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional
+
+EXTERNAL_ID_COLUMN = "external_id"
+
+
+def _time(records: pa.Table) -> np.ndarray:
+    return records["time"].cast(pa.int64()).to_numpy()
+
+
+def _sort_by_time(records: pa.Table) -> pa.Table:
+    order = np.argsort(_time(records), kind="stable")
+    if np.all(order[1:] > order[:-1]):
+        return records
+    return records.unify_dictionaries().take(pa.array(order))
+
+
+def _duplicates(records: pa.Table) -> Optional[np.ndarray]:
+    if EXTERNAL_ID_COLUMN not in records.column_names:
+        return None
+
+    # Only records at the same time as a neighbour can be duplicates, as the
+    # records are sorted by time.
+    time = _time(records)
+    same_time = np.diff(time) == 0
+    candidates = np.flatnonzero(np.r_[same_time, False] | np.r_[False, same_time])
+    if len(candidates) == 0:
+        return None
+
+    external_id = records[EXTERNAL_ID_COLUMN].take(pa.array(candidates))
+    valid = external_id.is_valid().to_numpy()
+    if not np.any(valid):
+        return None
+
+    keys = [time[candidates]] + [field.to_numpy() for field in external_id.flatten()]
+    seen = set()
+    duplicates = np.zeros(len(records), dtype=bool)
+    for index, is_valid, *key in zip(candidates, valid, *keys):
+        if not is_valid:
+            continue
+        key = tuple(key)
+        if key in seen:
+            duplicates[index] = True
+        seen.add(key)
+    return duplicates if np.any(duplicates) else None
+
+
+def deduplicate_records(records: pa.Table) -> pa.Table:
+    """
+    Remove records with the same time and external id as an earlier record,
+    in records sorted by time. Records without external id are kept.
+
+    >>> records = pa.table({
+    ...     "external_id": pa.array(
+    ...         [{"numeric": 1}, {"numeric": 2}, {"numeric": 1}, None, None],
+    ...         type=pa.struct([pa.field("numeric", pa.uint64())]),
+    ...     ),
+    ...     "time": pa.array([1, 2, 2, 2, 2], type=pa.timestamp("ns", tz="UTC")),
+    ...     "n": [1, 2, 3, 4, 5],
+    ... })
+    >>> deduplicate_records(records.take(pa.array([0, 1, 1, 2, 3, 4])))["n"].to_pylist()
+    [1, 2, 3, 4, 5]
+    """
+
+    duplicates = _duplicates(records)
+    if duplicates is None:
+        return records
+    return records.filter(pa.array(~duplicates))
+
+
+def merge_records(
+    inputs: Iterable[Iterator[pa.Table]],
+    starts: Optional[Iterable[int]] = None,
+) -> Iterator[pa.Table]:
+    """
+    Merge streams of records, each sorted by time, into one stream sorted by
+    time and without duplicates (see `deduplicate_records`). Only the current
+    table of each stream is held in memory: records are yielded as soon as
+    no stream can produce an earlier record anymore. Records of the same time
+    keep the order of their streams.
+
+    If the earliest possible time (in ns) of each stream is given in
+    `starts`, streams are only read once the merge reaches their start, so
+    that many streams of consecutive periods (e.g. WAL files) are merged one
+    or a few at a time.
+
+    >>> def stream(*times):
+    ...     for t in times:
+    ...         yield pa.table({"time": pa.array(t, type=pa.timestamp("ns", tz="UTC"))})
+    >>> merged = merge_records([stream([1, 4], [5, 9]), stream([2, 3], [3, 8])])
+    >>> [t["time"].cast(pa.int64()).to_pylist() for t in merged]
+    [[1, 2], [3, 3], [4, 5], [8], [9]]
+    >>> merged = merge_records([stream([1, 4]), stream([5, 9]), stream([2, 3])], [1, 5, 2])
+    >>> [t["time"].cast(pa.int64()).to_pylist() for t in merged]
+    [[1, 2], [3], [4, 5], [9]]
+    """
+
+    streams = [iter(stream) for stream in inputs]
+    start_times = list(starts) if starts is not None else [None] * len(streams)
+    unopened = sorted(
+        range(len(streams)),
+        key=lambda i: (start_times[i] is not None, start_times[i] or 0, i),
+        reverse=True,
+    )
+    buffers: Dict[int, pa.Table] = {}
+    last_times: Dict[int, int] = {}
+    pending: List[int] = []
+
+    def read(index: int):
+        records = next(streams[index], None)
+        while records is not None and records.num_rows == 0:
+            records = next(streams[index], None)
+
+        if records is None:
+            last_times.pop(index, None)
+        else:
+            if index in buffers:
+                records = pa.concat_tables([buffers[index], records])
+            buffers[index] = records
+            last_times[index] = _time(records)[-1]
+
+    while True:
+        for index in pending:
+            read(index)
+
+        # Open the streams starting before the active streams have reached.
+        while unopened:
+            start = start_times[unopened[-1]]
+            if last_times and start is not None and start > min(last_times.values()):
+                break
+            read(unopened.pop())
+
+        watermark = min(last_times.values()) if last_times else None
+        if unopened and watermark is not None:
+            watermark = min(watermark, start_times[unopened[-1]])  # type: ignore
+
+        # Yield all records before the watermark, which are complete, as
+        # every stream has reached it.
+        chunks = []
+        for index, records in list(buffers.items()):
+            if watermark is None:
+                split = records.num_rows
+            else:
+                split = int(np.searchsorted(_time(records), watermark, "left"))
+            if split > 0:
+                chunks.append((index, records.slice(0, split)))
+            if split < records.num_rows:
+                buffers[index] = records.slice(split)
+            else:
+                del buffers[index]
+
+        if chunks:
+            chunks.sort(key=lambda chunk: chunk[0])
+            tables = [table for _, table in chunks]
+            merged = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+            yield deduplicate_records(_sort_by_time(merged))
+
+        if watermark is None:
+            return
+
+        pending = [i for i, last in last_times.items() if last == watermark]
@@ -1,6 +1,7 @@
-import pyarrow.compute as pc
 import pyarrow as pa
 import numpy as np
+import pandas
+from functools import lru_cache
 from typing import Iterator, Tuple, List
 from ..model.types import (
     SubjectSymbol,
@@ -16,64 +17,94 @@ DAY_NANOSECONDS = 24 * 60 * 60 * 10 ** 9
 PARTITION_COLUMNS = ["subject", "source", "exchange", "instrument"]
 
 
-def _hash_array(array: pa.ChunkedArray) -> Tuple[int, pa.ChunkedArray]:
-    if isinstance(array.type, pa.DictionaryType):
-        encoded = array
-    else:
-        encoded = array.dictionary_encode()
+@lru_cache(maxsize=4096)
+def _partition_symbols(
+    subject: str,
+    source: str,
+    exchange: str,
+    instrument: str,
+) -> Tuple[SubjectSymbol, SourceSymbol, MarketSymbol]:
     return (
-        len(encoded.chunk(0).dictionary),
-        pa.chunked_array(
-            [chunk.indices.cast(pa.int64()) for chunk in encoded.iterchunks()]
+        SubjectSymbol(subject),
+        SourceSymbol(source),
+        MarketSymbol(
+            ExchangeSymbol(exchange), InstrumentSymbol.from_symbol(instrument)
         ),
     )
 
 
-def _hash_arrays(arrays: List[pa.ChunkedArray]) -> Tuple[int, pa.ChunkedArray]:
-    if len(arrays) == 1:
-        return _hash_array(arrays[0])
+def _encode_columns(records: pa.Table) -> List[Tuple[pa.Array, np.ndarray]]:
+    columns = []
+    for name in PARTITION_COLUMNS:
+        column = records[name]
+        if not isinstance(column.type, pa.DictionaryType):
+            column = column.dictionary_encode()
+        columns.append(column)
 
-    head_max, head_hashes = _hash_array(arrays[0])
-    tail_max, tail_hashes = _hash_arrays(arrays[1:])
-
-    if head_max == 1:
-        return (tail_max, tail_hashes)
-
-    return (
-        head_max * tail_max,
-        pc.add(pc.multiply(head_hashes, tail_max), tail_hashes),
-    )
-
-
-def _run_length_encoding(arrays: List[pa.ChunkedArray]) -> Iterator[Tuple[int, int]]:
-    size, hashes = _hash_arrays(arrays)
-
-    # Inspired by https://gist.github.com/nvictus/66627b580c13068589957d6ab0919e66
-    where = np.flatnonzero
-    starts = np.r_[0, where(np.diff(hashes.to_numpy())) + 1]
-    stops = np.r_[starts[1:], len(hashes)]
-    return zip(starts.tolist(), stops.tolist())
-
-
-def _fileid_from_chunk(chunk: pa.Table) -> FileId:
-    timestamp = Timestamp(chunk["time"][0].as_py())
-    subject = SubjectSymbol(chunk["subject"][0].as_py())
-    source = SourceSymbol(chunk["source"][0].as_py())
-    exchange = ExchangeSymbol(chunk["exchange"][0].as_py())
-    instrument = InstrumentSymbol.from_symbol(chunk["instrument"][0].as_py())
-    market = MarketSymbol(exchange, instrument)
-    file = FileId(subject, source, market, timestamp)
-    return file
+    # One dictionary per column, shared by all chunks.
+    unified = pa.Table.from_arrays(columns, PARTITION_COLUMNS).unify_dictionaries()
+    encoded = []
+    for column in unified.itercolumns():
+        chunks = column.chunks
+        indices = np.concatenate(
+            [chunk.indices.to_numpy(zero_copy_only=False) for chunk in chunks]
+        )
+        encoded.append((chunks[0].dictionary, indices.astype(np.int64)))
+    return encoded
 
 
 def partition_records(records: pa.Table) -> Iterator[Tuple[FileId, pa.Table]]:
-    time = records["time"].cast(pa.int64())
+    """
+    Split records into runs of the same partition (subject, source, market)
+    and day, each with the file id of its first record. The runs are slices
+    of the records, without the partition columns.
+
+    >>> def dictionary(values):
+    ...     return pa.array(values).dictionary_encode()
+    >>> records = pa.table({
+    ...     "time": pa.array([0, 1, 2, DAY_NANOSECONDS], type=pa.timestamp("ns", tz="UTC")),
+    ...     "subject": dictionary(["trades"] * 4),
+    ...     "source": dictionary(["kraken"] * 4),
+    ...     "exchange": dictionary(["kraken"] * 4),
+    ...     "instrument": dictionary(["btc/eur", "btc/eur", "eth/eur", "eth/eur"]),
+    ... })
+    >>> for file, chunk in partition_records(records):
+    ...     print(file, len(chunk), chunk.column_names)
+    trades:kraken:kraken:btc/eur:1970-01-01T00:00:00.000000000Z 2 ['time']
+    trades:kraken:kraken:eth/eur:1970-01-01T00:00:00.000000002Z 1 ['time']
+    trades:kraken:kraken:eth/eur:1970-01-02T00:00:00.000000000Z 1 ['time']
+    """
+
+    if records.num_rows == 0:
+        return
+
+    time = records["time"].cast(pa.int64()).to_numpy()
     assert records["time"].type.tz == "UTC", "time column must be in UTC"
-    assert np.all(np.diff(time.to_numpy()) >= 0), "time column must be monotonic"
-
-    date = pc.divide(time, DAY_NANOSECONDS)
-
-    partition_columns = [records[name] for name in PARTITION_COLUMNS] + [date]
-    for start, stop in _run_length_encoding(partition_columns):
-        chunk = records[start:stop]
-        yield _fileid_from_chunk(chunk), chunk.drop(PARTITION_COLUMNS)
+    assert np.all(np.diff(time) >= 0), "time column must be monotonic"
+
+    # Combine the dictionary indices of the partition columns and the day into
+    # one key per record, to find the runs in one pass.
+    encoded = _encode_columns(records)
+    keys = np.zeros(len(time), dtype=np.int64)
+    for dictionary, indices in encoded:
+        keys = keys * len(dictionary) + indices
+    days = time // DAY_NANOSECONDS
+    changes = (keys[1:] != keys[:-1]) | (days[1:] != days[:-1])
+    starts = np.r_[0, np.flatnonzero(changes) + 1]
+    stops = np.r_[starts[1:], len(time)]
+
+    data = records.drop(PARTITION_COLUMNS)
+    symbols = {}
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        key = keys[start]
+        if key not in symbols:
+            values = [
+                dictionary[indices[start]].as_py() for dictionary, indices in encoded
+            ]
+            symbols[key] = _partition_symbols(*values)
+
+        subject, source, market = symbols[key]
+        timestamp = Timestamp(pandas.Timestamp(time[start], tz="UTC"))
+        yield FileId(subject, source, market, timestamp), data.slice(
+            start, stop - start
+        )
@@ -1,5 +1,6 @@
 import asyncio
-from typing import List, AsyncIterable
+from typing import Deque, List, AsyncIterable
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from pyarrow import Table
 from ..model.types import FileId
@@ -7,6 +8,12 @@ from ..model.records import RecordsRepository
 from .partitioning import partition_records
 from .session import Session
 
+# Maximum number of records tables being written at the same time.
+MAX_IN_FLIGHT = 4
+
+# Maximum size in bytes of the records tables submitted but not yet written.
+MAX_QUEUED_BYTES = 256 * 1024 * 1024
+
 
 class DatasetWriter:
     def __init__(
@@ -14,35 +21,119 @@ class DatasetWriter:
         write_ahead_log: RecordsRepository,
         *,
         session: Session = Session(),
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queued_bytes: int = MAX_QUEUED_BYTES,
     ):
         self._write_ahead_log = write_ahead_log
         self._session = session
+        self._pool_args = (max_in_flight, max_queued_bytes)
 
     async def write(self, records_stream: AsyncIterable[Table]):
-        async with self._session.resource(WriteAsyncPool):
-            async for records in records_stream:
-                await self.write_records(records)
+        """
+        Write a stream of records, overlapping the writes with reading the
+        stream. Reading pauses while the pool is at its limits, so a fast
+        stream never piles up records in memory.
+        """
+
+        async with self._session.resource(WriteAsyncPool, *self._pool_args) as pool:
+            writes: Deque["asyncio.Future[List[FileId]]"] = deque()
+            try:
+                async for records in records_stream:
+                    writes.append(await pool.submit(self._write_ahead_log, records))
+                    while writes and writes[0].done():
+                        await writes.popleft()
+                while writes:
+                    await writes.popleft()
+            finally:
+                if writes:
+                    await asyncio.gather(*writes, return_exceptions=True)
 
     async def write_records(self, records: Table):
-        async with self._session.resource(WriteAsyncPool) as pool:
+        async with self._session.resource(WriteAsyncPool, *self._pool_args) as pool:
             await pool.write_async(self._write_ahead_log, records)
 
 
 class WriteAsyncPool:
-    def __init__(self):
-        self._pool = ThreadPoolExecutor()
+    """
+    Thread pool writing records to a repository, with at most
+    `max_in_flight` writes and `max_queued_bytes` of records submitted and
+    not written yet. Submitting waits while the pool is at either limit. A
+    table larger than `max_queued_bytes` is let through alone.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queued_bytes: int = MAX_QUEUED_BYTES,
+    ):
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._max_in_flight = max_in_flight
+        self._max_queued_bytes = max_queued_bytes
+        self._in_flight = 0
+        self._queued_bytes = 0
+        self._condition = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+    async def submit(
+        self,
+        repository: RecordsRepository,
+        records: Table,
+    ) -> "asyncio.Future[List[FileId]]":
+        """
+        Wait for room in the pool and start writing records, returning the
+        future of the written files.
+        """
+
+        self._condition = self._condition or asyncio.Condition()
+        size = records.nbytes
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._has_room(size))
+            self._in_flight += 1
+            self._queued_bytes += size
+
+        return asyncio.ensure_future(self._write_and_release(repository, records))
 
     async def write_async(
         self,
         repository: RecordsRepository,
         records: Table,
     ) -> List[FileId]:
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(self._pool, self._write, repository, records)
+        return await (await self.submit(repository, records))
 
     async def close(self):
         self._pool.shutdown()
 
+    def _has_room(self, size: int) -> bool:
+        if self._in_flight == 0:
+            return True
+        return (
+            self._in_flight < self._max_in_flight
+            and self._queued_bytes + size <= self._max_queued_bytes
+        )
+
+    async def _write_and_release(
+        self,
+        repository: RecordsRepository,
+        records: Table,
+    ) -> List[FileId]:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._pool, self._write, repository, records
+            )
+        finally:
+            async with self._condition:  # type: ignore
+                self._in_flight -= 1
+                self._queued_bytes -= records.nbytes
+                self._condition.notify_all()  # type: ignore
+
     def _write(self, repository: RecordsRepository, records: Table) -> List[FileId]:
         files = []
 
@@ -0,0 +1,112 @@
+"""
+Benchmark `dataset download` end-to-end without a network, by replaying a
+cassette of Kraken REST responses.
+
+Without arguments, a synthetic cassette is generated with a number of markets,
+each with a number of 1000-trade pages. A cassette recorded from the real API
+(`dataset download --record kraken.jsonl.gz`) can be given instead. The
+client-side rate limit is lifted, so the benchmark measures the throughput of
+the ingest pipeline (parsing, splitting, writing and indexing) plus the
+replayed latency.
+
+Run with:
+
+    env PYTHONPATH=lib python3 spikes/bjarke/benchmark_download_replay.py [cassette] [latency] [concurrency]
+"""
+
+import asyncio, importlib, sys, tempfile, time
+import numpy as np
+from pathlib import Path
+
+from dataset.infrastructure.request import RATE_LIMITS, RateLimit, request_context
+from dataset.infrastructure.cassette import Cassette, ReplayTransport
+
+# The module, as `dataset.cli.download` is also the name of the click command.
+download_module = importlib.import_module("dataset.cli.download")
+
+NUM_MARKETS = 8
+NUM_PAGES = 20
+PAGE_SIZE = 1000
+URL = "https://api.kraken.com/0/public"
+
+
+def synthetic_cassette() -> Cassette:
+    rng = np.random.default_rng(42)
+    cassette = Cassette()
+
+    pairs = {}
+    for i in range(NUM_MARKETS):
+        pairs[f"XASSET{i}ZEUR"] = {
+            "altname": f"ASSET{i}EUR",
+            "wsname": f"ASSET{i}/EUR",
+            "pair_decimals": 1,
+            "lot_decimals": 8,
+        }
+    cassette.record(
+        "POST", f"{URL}/AssetPairs", {"json": {}}, {"error": [], "result": pairs}
+    )
+
+    for name in pairs.keys():
+        since = 0
+        time_s = 1604188800.0
+        for page in range(NUM_PAGES + 1):
+            trades = []
+            if page < NUM_PAGES:
+                times = time_s + np.cumsum(rng.integers(1, 200000, PAGE_SIZE)) / 10 ** 4
+                prices = rng.integers(10 ** 5, 2 * 10 ** 5, PAGE_SIZE) / 10
+                amounts = rng.integers(1, 10 ** 10, PAGE_SIZE) / 10 ** 8
+                sides = rng.choice(["b", "s"], PAGE_SIZE)
+                orders = rng.choice(["m", "l"], PAGE_SIZE)
+                trades = [
+                    [f"{p:.5f}", f"{a:.8f}", float(t), str(s), str(o), ""]
+                    for p, a, t, s, o in zip(prices, amounts, times, sides, orders)
+                ]
+                time_s = float(times[-1])
+            last = int(time_s * 10 ** 9) + 1 if trades else since
+            cassette.record(
+                "POST",
+                f"{URL}/Trades",
+                {"json": {"pair": name, "since": since}},
+                {"error": [], "result": {name: trades, "last": str(last)}},
+            )
+            since = last
+
+    return cassette
+
+
+class CountingTransport(ReplayTransport):
+    num_trades = 0
+
+    async def request(self, method: str, url: str, **kwargs):
+        response = await super().request(method, url, **kwargs)
+        if url.endswith("/Trades"):
+            trades = response["result"].get(kwargs["json"]["pair"], [])
+            self.num_trades += len(trades)
+        return response
+
+
+def main():
+    args = sys.argv[1:]
+    cassette = Cassette.load(Path(args[0])) if args and args[0] else None
+    cassette = cassette or synthetic_cassette()
+    latency = float(args[1]) if len(args) > 1 else 0.05
+    concurrency = int(args[2]) if len(args) > 2 else 4
+
+    RATE_LIMITS["api.kraken.com/0/public/"] = RateLimit(limit=10 ** 6, decay=10 ** 6)
+    transport = CountingTransport(cassette, latency=latency)
+    request_context().replay(transport)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t = time.perf_counter()
+        asyncio.run(download_module.download_async(tmp, 3600, concurrency))
+        elapsed = time.perf_counter() - t
+
+    print(f"\n{cassette}, latency {latency * 1000:.0f} ms, concurrency {concurrency}")
+    num_trades = transport.num_trades
+    num_requests = transport.num_requests
+    print(f"  {num_requests} requests, {num_trades} trades in {elapsed:.2f} s")
+    print(f"  {num_trades / elapsed:.0f} trades/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark parsing and ordering file ids, as when listing and merging the
+files of a write-ahead log: tens of thousands of timestamped files of a few
+markets are parsed (twice, as when the same files are listed again), sorted
+and checked to be ordered pairwise like `RecordsRepository.find()` does.
+
+Run with:
+
+    env PYTHONPATH=lib python3 spikes/bjarke/benchmark_fileids.py [num_files]
+"""
+
+import sys, time
+import numpy as np
+import pandas
+
+from datatool.model.types import FileId
+
+NUM_FILES = 50000
+NUM_MARKETS = 20
+
+
+def fileid_strings(rng, num_files):
+    times = 1577836800 * 10 ** 9 + np.cumsum(rng.integers(0, 10 ** 11, num_files))
+    markets = rng.integers(0, NUM_MARKETS, num_files)
+    return [
+        "trades:kraken-rest:kraken:asset%d/eur:%s"
+        % (market, pandas.Timestamp(t, tz="UTC").isoformat().replace("+00:00", "Z"))
+        for market, t in zip(markets.tolist(), times.tolist())
+    ]
+
+
+def measure(name, fn):
+    t = time.perf_counter()
+    result = fn()
+    print(f"  {name:<12} {time.perf_counter() - t:7.3f} s")
+    return result
+
+
+def main():
+    args = sys.argv[1:]
+    num_files = int(args[0]) if args else NUM_FILES
+
+    strings = fileid_strings(np.random.default_rng(42), num_files)
+
+    print(f"{num_files} file ids of {NUM_MARKETS} markets:")
+    measure("parse", lambda: [FileId.from_str(s) for s in strings])
+    fileids = measure("parse again", lambda: [FileId.from_str(s) for s in strings])
+    fileids = measure("sort", lambda: sorted(fileids))
+    measure("compare", lambda: all(a < b for a, b in zip(fileids, fileids[1:])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark `partition_records()` on WAL imports of mixed markets.
+
+It compares the old implementation (recursive hashing of the partition
+columns with pyarrow.compute, and symbols and a file id built from `.as_py()`
+values for every run) with the vectorized one, on 10M synthetic trades of a
+number of markets, interleaved in short runs like a multi-market import. The
+file ids and records of all runs are checked to be identical.
+
+Run with:
+
+    env PYTHONPATH=lib python3 spikes/bjarke/benchmark_partition_records.py [num_rows] [batch_size]
+"""
+
+import sys, time
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from datatool.model.types import (
+    SubjectSymbol,
+    SourceSymbol,
+    ExchangeSymbol,
+    InstrumentSymbol,
+    MarketSymbol,
+    Timestamp,
+    FileId,
+)
+from datatool.write.partitioning import (
+    DAY_NANOSECONDS,
+    PARTITION_COLUMNS,
+    partition_records,
+)
+
+NUM_ROWS = 10 ** 7
+BATCH_SIZE = 10 ** 6
+NUM_MARKETS = 20
+MEAN_RUN_LENGTH = 50
+
+
+def _hash_array(array):
+    if isinstance(array.type, pa.DictionaryType):
+        encoded = array
+    else:
+        encoded = array.dictionary_encode()
+    return (
+        len(encoded.chunk(0).dictionary),
+        pa.chunked_array(
+            [chunk.indices.cast(pa.int64()) for chunk in encoded.iterchunks()]
+        ),
+    )
+
+
+def _hash_arrays(arrays):
+    if len(arrays) == 1:
+        return _hash_array(arrays[0])
+
+    head_max, head_hashes = _hash_array(arrays[0])
+    tail_max, tail_hashes = _hash_arrays(arrays[1:])
+
+    if head_max == 1:
+        return (tail_max, tail_hashes)
+
+    return (
+        head_max * tail_max,
+        pc.add(pc.multiply(head_hashes, tail_max), tail_hashes),
+    )
+
+
+def _run_length_encoding(arrays):
+    size, hashes = _hash_arrays(arrays)
+    starts = np.r_[0, np.flatnonzero(np.diff(hashes.to_numpy())) + 1]
+    stops = np.r_[starts[1:], len(hashes)]
+    return zip(starts.tolist(), stops.tolist())
+
+
+def _fileid_from_chunk(chunk):
+    timestamp = Timestamp(chunk["time"][0].as_py())
+    subject = SubjectSymbol(chunk["subject"][0].as_py())
+    source = SourceSymbol(chunk["source"][0].as_py())
+    exchange = ExchangeSymbol(chunk["exchange"][0].as_py())
+    instrument = InstrumentSymbol.from_symbol(chunk["instrument"][0].as_py())
+    market = MarketSymbol(exchange, instrument)
+    return FileId(subject, source, market, timestamp)
+
+
+def partition_records_old(records):
+    time = records["time"].cast(pa.int64())
+    date = pc.divide(time, DAY_NANOSECONDS)
+    partition_columns = [records[name] for name in PARTITION_COLUMNS] + [date]
+    for start, stop in _run_length_encoding(partition_columns):
+        chunk = records[start:stop]
+        yield _fileid_from_chunk(chunk), chunk.drop(PARTITION_COLUMNS)
+
+
+def random_records(rng, num_rows):
+    run_lengths = rng.geometric(1 / MEAN_RUN_LENGTH, num_rows // MEAN_RUN_LENGTH * 2)
+    run_lengths = run_lengths[np.cumsum(run_lengths) <= num_rows]
+    run_lengths = np.r_[run_lengths, num_rows - run_lengths.sum()]
+    markets = np.repeat(rng.integers(0, NUM_MARKETS, len(run_lengths)), run_lengths)
+    time = 1577836800 * 10 ** 9 + np.cumsum(rng.integers(0, 10 ** 8, num_rows))
+
+    def dictionary(values):
+        return pa.array(values).dictionary_encode().cast(
+            pa.dictionary(pa.int32(), pa.string())
+        )
+
+    instruments = np.array([f"asset{i}/eur" for i in range(NUM_MARKETS)])
+    return pa.table(
+        {
+            "time": pa.array(time, type=pa.timestamp("ns", tz="UTC")),
+            "price": rng.integers(1, 10 ** 9, num_rows),
+            "subject": dictionary(["trades"] * num_rows),
+            "source": dictionary(["kraken-rest"] * num_rows),
+            "exchange": dictionary(["kraken"] * num_rows),
+            "instrument": dictionary(instruments[markets]),
+        }
+    )
+
+
+def measure(fn, batches):
+    t = time.perf_counter()
+    num_runs = sum(1 for batch in batches for _ in fn(batch))
+    return num_runs, time.perf_counter() - t
+
+
+def main():
+    args = sys.argv[1:]
+    num_rows = int(args[0]) if args else NUM_ROWS
+    batch_size = int(args[1]) if len(args) > 1 else BATCH_SIZE
+
+    rng = np.random.default_rng(42)
+    records = random_records(rng, num_rows)
+    batches = [records.slice(i, batch_size) for i in range(0, num_rows, batch_size)]
+
+    for old, new in zip(
+        partition_records_old(batches[0]), partition_records(batches[0])
+    ):
+        assert old[0] == new[0] and old[1].equals(new[1]), (old, new)
+
+    num_runs, new_seconds = measure(partition_records, batches)
+    _, old_seconds = measure(partition_records_old, batches)
+
+    print(f"{num_rows} rows of {NUM_MARKETS} markets in batches of {batch_size}:")
+    print(f"  {num_runs} runs, identical file ids and records")
+    print(f"  old:        {old_seconds:7.2f} s ({num_rows / old_seconds:.0f} rows/s)")
+    print(f"  vectorized: {new_seconds:7.2f} s ({num_rows / new_seconds:.0f} rows/s)")
+    print(f"  speedup:    {old_seconds / new_seconds:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
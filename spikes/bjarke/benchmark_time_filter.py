@@ -0,0 +1,102 @@
+"""
+Benchmark the time filter of the query layer on a month of synthetic trades.
+
+It compares the old filter (comparing the time column to an ISO string, which
+needs a cast of every row) with the typed timestamp filter emitted by
+`Query.dataset_filter()`. For each narrow intraday window it reports the
+number of rows in the row groups that survive the Parquet statistics, i.e.
+the rows that have to be decoded, and the time to read the window.
+
+The old filter is emulated by casting the time column before comparing it,
+which has the same effect on row group statistics as the string comparison.
+
+Run with:
+
+    env PYTHONPATH=lib python3 spikes/bjarke/benchmark_time_filter.py
+"""
+
+import tempfile, time
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pathlib import Path
+from pandas import Timestamp, Timedelta
+
+from dataset.model.read.query import QueryBuilder
+from dataset.model.write.writer import PARQUET_WRITE_ARGS
+
+NUM_ROWS = 5000000
+ROW_GROUP_SIZE = 65536
+MONTH = Timestamp("2020-11-01", tz="UTC")
+
+
+def write_month(path: Path):
+    rng = np.random.default_rng(42)
+    month_ns = 30 * 24 * 60 * 60 * 10 ** 9
+    time_ns = np.sort(rng.integers(0, month_ns, NUM_ROWS)) + MONTH.value
+    table = pa.table(
+        {
+            "time": pa.array(time_ns, type=pa.timestamp("ns", tz="UTC")),
+            "price": pa.array(rng.integers(1, 10 ** 7, NUM_ROWS).astype("uint64")),
+            "amount": pa.array(rng.integers(1, 10 ** 8, NUM_ROWS).astype("uint64")),
+        }
+    )
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, **PARQUET_WRITE_ARGS)
+
+
+def cast_filter(start: Timestamp, end: Timestamp):
+    # Like the old ISO string comparison, the time column has to be cast on
+    # every row before it can be compared, so statistics can not be used.
+    time_cast = ds.field("time").cast(pa.int64())  # type: ignore
+    return (time_cast >= start.value) & (time_cast < end.value)
+
+
+def typed_filter(start: Timestamp, end: Timestamp):
+    return QueryBuilder().trades().start(start).end(end).build().dataset_filter()
+
+
+def rows_decoded(dataset, dataset_filter) -> int:
+    rows = 0
+    for fragment in dataset.get_fragments(filter=dataset_filter):
+        row_groups = fragment.split_by_row_group(dataset_filter, dataset.schema)
+        for row_group in row_groups:
+            rows += sum(info.num_rows for info in row_group.row_groups)
+    return rows
+
+
+def measure(dataset, dataset_filter):
+    t = time.perf_counter()
+    table = dataset.to_table(filter=dataset_filter)
+    elapsed = time.perf_counter() - t
+    return rows_decoded(dataset, dataset_filter), len(table), elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "year=2020" / "2020-11.trades.parquet"
+        path.parent.mkdir()
+        write_month(path)
+        dataset = ds.dataset(tmp, format="parquet", partitioning="hive")
+        print(f"{NUM_ROWS} rows, {pq.read_metadata(path).num_row_groups} row groups")
+
+        windows = [
+            (Timedelta(days=3, hours=10), Timedelta(minutes=1)),
+            (Timedelta(days=12, hours=14), Timedelta(minutes=15)),
+            (Timedelta(days=20), Timedelta(hours=1)),
+            (Timedelta(days=27, hours=8), Timedelta(hours=6)),
+        ]
+        for offset, duration in windows:
+            start = MONTH + offset
+            end = start + duration
+            print(f"\n{start} + {duration}:")
+            for name, fn in [("cast", cast_filter), ("typed", typed_filter)]:
+                decoded, matched, elapsed = measure(dataset, fn(start, end))
+                print(
+                    f"  {name:>6}: decoded {decoded:>8} rows,"
+                    f" matched {matched:>6} rows, {elapsed * 1000:7.1f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark the write profiles of `RecordsWriter` on a month of btc/eur trades.
+
+For each profile it reports the file size, the write throughput, the read
+throughput of the whole file and of the price column, and the time to read
+one hour with `RecordsRepository.get()`, which skips row groups by their
+time statistics.
+
+The trades are read from a Parquet file or directory of trades records
+(e.g. the kraken btc/eur files of a month of a WAL). Without a path, a month
+of synthetic trades is generated: times and prices are random walks, like
+real trades, so delta encodings get realistic input.
+
+Run with:
+
+    env PYTHONPATH=lib python3 spikes/bjarke/benchmark_write_profiles.py [path]
+"""
+
+import sys, tempfile, time
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from pandas import Timedelta, Timestamp as PandasTimestamp
+
+from datatool.model.types import FileId, Timestamp
+from datatool.write.schema import trades_schema, partition_fields
+from datatool._infrastructure.records import WRITE_PROFILES, RecordsRepository
+
+NUM_ROWS = 4000000
+MONTH = PandasTimestamp("2020-11-01", tz="UTC")
+FILE = FileId.from_str("trades:kraken-rest:kraken:btc/eur:2020-11")
+
+
+def dictionary(values):
+    return (
+        pa.array(values)
+        .dictionary_encode()
+        .cast(pa.dictionary(pa.int32(), pa.string()))
+    )
+
+
+def decimals(ints, scale):
+    return pa.StructArray.from_arrays(
+        [
+            pa.array(ints, type=pa.uint64()),
+            pa.array(np.full(len(ints), scale, np.int32)),
+        ],
+        fields=list(trades_schema.field("price").type),
+    )
+
+
+def synthetic_trades(num_rows):
+    rng = np.random.default_rng(42)
+    month_ns = 30 * 24 * 60 * 60 * 10 ** 9
+    time_ns = MONTH.value + np.sort(rng.integers(0, month_ns, num_rows))
+    price = 1500000 + np.cumsum(rng.integers(-20, 21, num_rows))
+    amount = rng.lognormal(14, 2, num_rows).astype(np.uint64) + 1
+    external_id = pa.StructArray.from_arrays(
+        [
+            pa.nulls(num_rows, pa.string()),
+            pa.array(np.arange(num_rows, dtype=np.uint64) + 10 ** 9),
+            pa.nulls(num_rows, pa.binary(16)),
+        ],
+        fields=list(trades_schema.field("external_id").type),
+    )
+    return pa.table(
+        {
+            "external_id": external_id,
+            "time": pa.array(time_ns, type=pa.timestamp("ns", tz="UTC")),
+            "price": decimals(price, 1),
+            "amount": decimals(amount, 8),
+            "side": dictionary(rng.choice(["buy", "sell"], num_rows)),
+            "order": dictionary(
+                rng.choice(["market", "limit"], num_rows, p=[0.3, 0.7])
+            ),
+            "extra_json": pa.nulls(num_rows, pa.string()),
+        }
+    )
+
+
+def read_trades(path: Path):
+    records = pq.read_table(path)
+    names = [f.name for f in partition_fields if f.name in records.column_names]
+    return records.drop(names)
+
+
+def measure(fn, repeat=3):
+    seconds = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - t)
+    return min(seconds)
+
+
+def main():
+    args = sys.argv[1:]
+    records = read_trades(Path(args[0])) if args else synthetic_trades(NUM_ROWS)
+    num_rows = len(records)
+    start = Timestamp(records["time"][num_rows // 2].as_py())
+    end = Timestamp(start.timestamp + Timedelta(hours=1))
+
+    print(f"{num_rows} trades, {records.nbytes / 2 ** 20:.0f} MiB in memory:")
+    print(
+        f"  {'profile':<8} {'size':>9} {'write':>12} {'read':>12}"
+        f" {'read price':>12} {'read 1 hour':>12}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in WRITE_PROFILES:
+            repository = RecordsRepository(Path(tmp) / name, profile=name)
+            write_seconds = measure(
+                lambda: repository.writer(FILE).write(records).close(), repeat=1
+            )
+            size = sum(p.stat().st_size for p in (Path(tmp) / name).rglob("*.parquet"))
+            read_seconds = measure(lambda: repository.get(FILE))
+            price_seconds = measure(lambda: repository.get(FILE, columns=["price"]))
+            hour_seconds = measure(lambda: repository.get(FILE, start=start, end=end))
+            print(
+                f"  {name:<8} {size / 2 ** 20:5.1f} MiB"
+                f" {num_rows / write_seconds / 10 ** 6:6.2f} Mrec/s"
+                f" {num_rows / read_seconds / 10 ** 6:6.2f} Mrec/s"
+                f" {num_rows / price_seconds / 10 ** 6:6.2f} Mrec/s"
+                f" {hour_seconds * 1000:9.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -87,29 +87,32 @@ def import_records(data_dir, *, filter=None, batch_size=1000):
                 yield get_records(pa.Table.from_batches([batch]))
 
 
+def get_fileid(records):
+    row = dict((key, column[0]) for key, column in records[0:1].to_pydict().items())
+    fileid_parts = [
+        row["subject"],
+        row["source"],
+        row["exchange"],
+        row["instrument"].replace("_", "/"),
+        Timestamp(row["time"]).isoformat(),
+    ]
+    return ":".join(fileid_parts)
+
+
 async def main():
     wal = RecordsRepository(ROOT_DIR / "wal")
     writer = DatasetWriter(wal)
     f = None
     # f = ds.field("instrument") == "ada_eth"
-    for records in import_records(ROOT_DIR / "data", filter=f, batch_size=10000):
-        row = dict((key, column[0]) for key, column in records[0:1].to_pydict().items())
-        fileid_parts = [
-            row["subject"],
-            row["source"],
-            row["exchange"],
-            row["instrument"].replace("_", "/"),
-            Timestamp(row["time"]).isoformat(),
-        ]
-        fileid = ":".join(fileid_parts)
-
-        try:
-            await writer.write_records(records)
-            print(f"{fileid} ({len(records)})")
-        except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
-            raise
-        except Exception as error:
-            print(f"{fileid} ({len(records)}) - ERROR: {error}")
+
+    # Import is paced by the writer, which stops reading when its write pool
+    # is full.
+    async def records_stream():
+        for records in import_records(ROOT_DIR / "data", filter=f, batch_size=10000):
+            print(f"{get_fileid(records)} ({len(records)})")
+            yield records
+
+    await writer.write(records_stream())
 
 
 if __name__ == "__main__":